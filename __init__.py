@@ -14,16 +14,120 @@ __author__ = "Stefan T. Keller"
 __version__ = '1.0'
 
 
-import errval
-from errval import *
+'''
+The submodules are imported lazily, on first access of one of their names:
+import errorvalues only costs what is actually used,
+and errval alone doesn't even need numpy.
+'''
 
-import errvallist
-from errvallist import *
+import os
+import sys
+import importlib
+from types import ModuleType
 
-import stderrval
-from stderrval import *
+# the modules that used to be star-imported, in that order (later ones take precedence)
+_STARRED = ['errval','errvallist','stderrval','functions','fileio',
+            'lazy','dual','montecarlo','resampling']
+_MODULES = _STARRED + ['ufuncs','instrument','formatting','errarray','fitting','parallel']
 
-import functions
-from functions import *
+# name: submodule that provides it
+_EXPORTS = {
+    'errval': 'errval',
+    'errvallist': 'errvallist',
+    'errarray': 'errarray',
+    'stderrval': 'stderrval',
+    'stderrvallist': 'stderrval',
+    'stderrarray': 'stderrval',
+    'runningstderrval': 'stderrval',
+    'runningstderrvallist': 'stderrval',
+    'stderrvallist_mmap': 'stderrval',
+    'values': 'functions',
+    'errors': 'functions',
+    'tuples': 'functions',
+    'str2errvallist': 'functions',
+    'max': 'functions',
+    'min': 'functions',
+    'wmean': 'functions',
+    'groupwmean': 'functions',
+    'interp': 'functions',
+    'interplist': 'functions',
+    'reorder': 'functions',
+    'sorting_instr': 'functions',
+    'linreg': 'functions',
+    'linreg_batch': 'functions',
+    'linfit': 'fitting',
+    'linfit_batch': 'fitting',
+    'linfit_eval': 'fitting',
+    'curvefit': 'fitting',
+    'curvefit_batch': 'fitting',
+    'parse_errvals': 'fileio',
+    'read_errvals': 'fileio',
+    'write_errvals': 'fileio',
+    'save_errvallist': 'fileio',
+    'load_errvallist': 'fileio',
+    'lazyval': 'lazy',
+    'lazy': 'lazy',
+    'dual': 'dual',
+    'propagate': 'dual',
+    'montecarlo': 'montecarlo',
+    'jackknife': 'resampling',
+    'bootstrap': 'resampling',
+    'instrumented': 'instrument',
+    'format_errvals': 'formatting',
+    'round_significant': 'formatting',
+    'write_table': 'formatting',
+    }
 
-#__all__ = ['errval','errvallist','stderrval','functions']
+__all__ = sorted(_EXPORTS)
+
+
+def _submodule(name):
+    return importlib.import_module('.'+name,__name__)
+
+def _shadowed(name):
+    # the submodule of the same name ends up in the package dict once imported,
+    # the property takes precedence over it
+    return property(lambda package: getattr(_submodule(_EXPORTS[name]),name))
+
+class _lazypackage(ModuleType):
+    def __getattr__(self,name):
+        # only called for names not (yet) in the package dict
+        if name in _EXPORTS:
+            value = getattr(_submodule(_EXPORTS[name]),name)
+        elif name in _MODULES:
+            value = _submodule(name)
+        elif not name.startswith('__'):
+            # anything else the star imports used to provide (np, ...)
+            for module in reversed(self._load_all()):
+                if hasattr(module,name):
+                    value = getattr(module,name)
+                    break
+            else:
+                raise AttributeError, "'{0}' has no attribute '{1}'".format(__name__,name)
+        else:
+            raise AttributeError, name
+        self.__dict__[name] = value
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_EXPORTS) | set(_MODULES))
+
+    def _load_all(self):
+        # import all submodules, returns the star-imported ones
+        for name in _MODULES:
+            _submodule(name)
+        return [sys.modules[__name__+'.'+name] for name in _STARRED]
+
+for _name in _EXPORTS:
+    if _name in _MODULES:
+        setattr(_lazypackage,_name,_shadowed(_name))
+
+# replace this module by the lazy package;
+# the original is kept alive (as _module), its globals are the ones of the functions above
+_module = sys.modules[__name__]
+_package = _lazypackage(__name__,__doc__)
+_package.__dict__.update(_module.__dict__)
+sys.modules[__name__] = _package
+
+if os.environ.get('ERRORVALUES_INSTRUMENT','') not in ('','0'):
+    _submodule('instrument')._from_environment()
@@ -0,0 +1,226 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Benchmarks of the hot paths of errorvalues.
+
+    python bench.py run [-o results.json] [--sizes 1000 10000 100000] [--only linreg ...]
+    python bench.py compare baseline.json results.json [--threshold 0.2]
+
+run times every benchmark at every size (best of --repeat)
+and records the peak memory it needed;
+each benchmark runs in a fresh process of its own, whose high water mark is reported as is:
+interpreter, imports and inputs included, which is the same offset for every version,
+so the differences between runs belong to the benchmark alone.
+A benchmark whose process crashes (or exceeds --timeout) is reported as failed.
+The results go to a json file.
+
+compare flags every benchmark that got slower (or needs more memory)
+than the baseline by more than threshold (relative), or that failed,
+and exits with 1 if there is any.
+
+Like the tests, this expects errorvalues to be importable.
+'''
+
+import sys
+import json
+import time
+import timeit
+import resource
+import platform
+import argparse
+from multiprocessing import Process, Queue
+from Queue import Empty
+
+import numpy as np
+import errorvalues as ev
+
+
+# -----------------------------------------------------------------------
+# every benchmark: setup(n) returns the arguments of run, only run is timed
+
+def _errvallist(n,seed=0):
+    rng = np.random.RandomState(seed)
+    return ev.errvallist(rng.randn(n),rng.rand(n)+0.1)
+
+def _setup_scalar(n):
+    return [ev.errval(1.5,0.1), ev.errval(2.5,0.2), n]
+def _run_scalar(a,b,n):
+    for _ in xrange(n):
+        a*b + a/b - a**2
+
+def _run_listops(a,b):
+    (a+b)-(a*b)/b
+
+def _run_extraction(a):
+    a.v()
+    a.e()
+
+def _setup_linreg(n):
+    rng = np.random.RandomState(0)
+    x = np.linspace(0,1,n)
+    s = rng.rand(n)+0.1
+    return [x, 2*x+1+s*rng.randn(n), s]
+def _run_linreg(x,y,s):
+    ev.linreg(x,y,s)
+
+def _setup_interplist(n):
+    x = np.linspace(0,1,n)
+    return [np.random.RandomState(0).rand(n), x, _errvallist(n)]
+def _run_interplist(v,x,y):
+    ev.interplist(v,x,y)
+
+def _run_sorting(a):
+    ev.reorder(a,ev.sorting_instr(a))
+
+def _run_wmean(a):
+    ev.wmean(a)
+
+def _setup_str2errvallist(n):
+    a = _errvallist(n)
+    a.printout('cp')
+    return ['+'.join(['{}'.format(x) for x in a])]
+def _run_str2errvallist(s):
+    ev.str2errvallist(s)
+
+def _setup_stderrvallist(n):
+    return [np.random.RandomState(0).randn(50,n)]
+def _run_stderrvallist(li):
+    ev.stderrvallist(li)
+
+BENCHMARKS = [
+    # name, setup(n), run(*setup(n))
+    ('errval_arithmetic', _setup_scalar, _run_scalar),
+    ('errvallist_operators', lambda n: [_errvallist(n,0),_errvallist(n,1)], _run_listops),
+    ('errvallist_v_e', lambda n: [_errvallist(n)], _run_extraction),
+    ('linreg', _setup_linreg, _run_linreg),
+    ('interplist', _setup_interplist, _run_interplist),
+    ('sorting_instr', lambda n: [_errvallist(n)], _run_sorting),
+    ('wmean', lambda n: [_errvallist(n)], _run_wmean),
+    ('str2errvallist', _setup_str2errvallist, _run_str2errvallist),
+    ('stderrvallist', _setup_stderrvallist, _run_stderrvallist),
+    ]
+
+
+# -----------------------------------------------------------------------
+
+def _peak_kb():
+    # high water mark of this process (kilobytes on Linux, bytes on OS X)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024 if sys.platform=='darwin' else peak
+
+def _measure(queue,setup,run,n,repeat):
+    # warm-up on a small instance: loads the (lazily imported) submodules
+    # on the path of run, such that the first timed run doesn't pay for the imports
+    run(*setup(min(n,100)))
+    args = setup(n)
+    times = []
+    for _ in xrange(repeat):
+        t0 = timeit.default_timer()
+        run(*args)
+        times.append(timeit.default_timer()-t0)
+    queue.put((min(times),_peak_kb()))
+
+def measure(setup,run,n,repeat=3,timeout=600):
+    '''
+    time (best of repeat) and peak memory of run, in a fresh process
+    a process that dies (e.g. out of memory) or takes longer than timeout seconds
+    gives {'failed': reason} instead
+    '''
+    queue = Queue()
+    p = Process(target=_measure,args=(queue,setup,run,n,repeat))
+    p.start()
+    deadline = time.time()+timeout
+    while True:
+        try:
+            seconds, peak = queue.get(timeout=1)
+            break
+        except Empty:
+            if p.exitcode is not None:
+                failed = 'exit code {0}'.format(p.exitcode)
+            elif time.time()>deadline:
+                failed = 'timeout after {0} s'.format(timeout)
+            else:
+                continue
+            p.terminate()
+            p.join()
+            return {'failed': failed}
+    p.join()
+    return {'seconds': seconds, 'peak_kb': peak}
+
+def run(sizes,only=None,repeat=3,timeout=600,out=sys.stdout):
+    results = {}
+    for name, setup, runner in BENCHMARKS:
+        if only and name not in only: continue
+        for n in sizes:
+            key = '{0}[{1}]'.format(name,n)
+            res = results[key] = measure(setup,runner,n,repeat,timeout)
+            if 'failed' in res:
+                out.write('{0:35s} FAILED ({1})\n'.format(key,res['failed']))
+            else:
+                out.write('{0:35s} {1:10.6f} s {2:10d} kB\n'.format(key,res['seconds'],res['peak_kb']))
+            out.flush()
+    return {'meta': {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                     'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'machine': platform.platform()},
+            'results': results}
+
+def compare(baseline,current,threshold=0.2,min_seconds=1e-4,out=sys.stdout):
+    '''
+    returns the list of regressions:
+    (benchmark, quantity, baseline, current) where current > (1+threshold)*baseline,
+    or (benchmark, 'failed', None, reason) for a benchmark that failed now;
+    differences below min_seconds (or 1 MB) are considered noise
+    '''
+    regressions = []
+    for key in sorted(current['results']):
+        if 'failed' in current['results'][key]:
+            regressions.append((key,'failed',None,current['results'][key]['failed']))
+            out.write('{0:35s} FAILED ({1})  <-- REGRESSION\n'.format(key,current['results'][key]['failed']))
+            continue
+        if key not in baseline['results'] or 'failed' in baseline['results'][key]: continue
+        for quantity in ('seconds','peak_kb'):
+            old, new = baseline['results'][key][quantity], current['results'][key][quantity]
+            ratio = new*1.0/old if old>0 else (np.inf if new>0 else 1.0)
+            flag = ''
+            if ratio>1+threshold:
+                if quantity=='seconds' and new-old<min_seconds: continue
+                # memory is only meaningful above the resolution of the high water mark
+                if quantity=='peak_kb' and new-old<1024: continue
+                regressions.append((key,quantity,old,new))
+                flag = '  <-- REGRESSION'
+            if quantity=='seconds' or flag:
+                out.write('{0:35s} {1:10s} {2:12.6g} -> {3:12.6g} ({4:6.2f}x){5}\n'.format(
+                            key,quantity,old,new,ratio,flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='errorvalues benchmarks')
+    sub = parser.add_subparsers(dest='command')
+    prun = sub.add_parser('run',help='run the benchmarks')
+    prun.add_argument('-o','--output',default='bench_results.json')
+    prun.add_argument('--sizes',type=int,nargs='+',default=[1000,10000,100000])
+    prun.add_argument('--only',nargs='+',help='names of the benchmarks to run')
+    prun.add_argument('--repeat',type=int,default=3)
+    prun.add_argument('--timeout',type=float,default=600,help='seconds per benchmark and size')
+    pcmp = sub.add_parser('compare',help='flag regressions against a baseline')
+    pcmp.add_argument('baseline')
+    pcmp.add_argument('current')
+    pcmp.add_argument('--threshold',type=float,default=0.2)
+    pcmp.add_argument('--min-seconds',type=float,default=1e-4)
+    args = parser.parse_args(argv)
+
+    if args.command=='run':
+        results = run(args.sizes,args.only,args.repeat,args.timeout)
+        with open(args.output,'w') as f:
+            json.dump(results,f,indent=1,sort_keys=True)
+        return 1 if any(['failed' in r for r in results['results'].values()]) else 0
+    with open(args.baseline) as f: baseline = json.load(f)
+    with open(args.current) as f: current = json.load(f)
+    regressions = compare(baseline,current,args.threshold,args.min_seconds)
+    return 1 if regressions else 0
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Turn a plain numpy function into one that propagates errors:
+
+@propagate
+def f(a,b):
+    return np.exp(-a)*np.sin(b)/b
+
+f(errval(1,0.1),errvallist([1,2,3],[0.1,0.1,0.1])) # errvallist
+
+The function is evaluated once, on dual numbers:
+arrays of values that carry along their derivatives with respect to every input
+(forward mode differentiation).
+With those,
+ c = f(a+-da,b+-db)
+ => dc = sqrt( (df/da)**2 * da**2 + (df/db)**2 * db**2 )
+holds for the whole array at once, without any errval in between.
+f may use the arithmetic operators and the numpy ufuncs known to ufuncs.py.
+'''
+
+import functools
+import numpy as np
+
+from errval import *
+from errvallist import *
+from errarray import *
+import ufuncs
+
+
+class dual(object):
+    '''
+    value (number or array) with its derivatives
+    tangent[...,i] = d value / d input_i, of shape (shape of value)+(number of inputs,)
+    (the inputs go last, such that value and tangent broadcast alike)
+    '''
+    __array_priority__ = 100
+
+    def __init__(self,value,tangent):
+        self.value = value
+        self.tangent = tangent
+
+    def _apply(self,ufunc,*args):
+        values = [a.value if isinstance(a,dual) else a for a in args]
+        f, d = ufuncs.derivatives(ufunc,*values)
+        tangent = 0
+        for a, di in zip(args,d):
+            # plain numbers and arrays are constants, their tangent is 0
+            if isinstance(a,dual):
+                tangent = tangent + np.asarray(di)[...,None]*a.tangent
+        return dual(f,tangent)
+
+    def __add__(self,other): return self._apply(np.add,self,other)
+    def __radd__(self,other): return self._apply(np.add,other,self)
+    def __sub__(self,other): return self._apply(np.subtract,self,other)
+    def __rsub__(self,other): return self._apply(np.subtract,other,self)
+    def __mul__(self,other): return self._apply(np.multiply,self,other)
+    def __rmul__(self,other): return self._apply(np.multiply,other,self)
+    def __div__(self,other): return self._apply(np.divide,self,other)
+    def __rdiv__(self,other): return self._apply(np.divide,other,self)
+    def __truediv__(self,other): return self.__div__(other)
+    def __rtruediv__(self,other): return self.__rdiv__(other)
+    def __pow__(self,other): return self._apply(np.power,self,other)
+    def __rpow__(self,other): return self._apply(np.power,other,self)
+    def __neg__(self): return self._apply(np.negative,self)
+    def __pos__(self): return self
+    def __abs__(self): return self._apply(np.absolute,self)
+
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        # np.exp(dual) & co.
+        if method!='__call__' or kwargs or not ufuncs.supported(ufunc):
+            return NotImplemented
+        return self._apply(ufunc,*inputs)
+
+
+def propagate(f):
+    '''
+    decorator: f(a,b,...) written for plain numbers/arrays
+    becomes a function of errval's, errvallist's and errarray's (plain numbers are fine too)
+    that returns an errval, errvallist or errarray
+    (printout of the first input with an error)
+    '''
+    @functools.wraps(f)
+    def propagator(*args):
+        uncertain = [j for j, a in enumerate(args) if isinstance(a,(errval,errvallist,errarray))]
+        array = any([isinstance(a,errarray) for a in args])
+        k = len(uncertain)
+        inputs = list(args)
+        errors = []
+        for i, j in enumerate(uncertain):
+            a = args[j]
+            value = np.asarray(a.v(),dtype=np.float64)
+            tangent = np.zeros(value.shape+(k,))
+            tangent[...,i] = 1 # d input_i / d input_i
+            inputs[j] = dual(value,tangent)
+            errors.append(np.asarray(a.e(),dtype=np.float64))
+
+        res = f(*inputs)
+        if not isinstance(res,dual): # doesn't depend on any input with error
+            return ufuncs.wrap(res,np.zeros_like(res,dtype=np.float64),array=array)
+        error = ufuncs.combine(np.shape(res.value),[res.tangent[...,i] for i in xrange(k)],errors)
+        printout = args[uncertain[0]].printout() if uncertain else 'latex'
+        return ufuncs.wrap(res.value,error,printout,array)
+    return propagator
@@ -0,0 +1,310 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+N-dimensional arrays of errval's, e.g. image stacks (frames x rows x cols)
+with an error per pixel:
+
+a = errarray(frames,np.sqrt(frames))  # values, errors of the same shape (or broadcastable)
+a.shape                               # (frames, rows, cols)
+a[0]                                  # first frame, a view
+a[:,10:20,10:20].mean(axis=0)         # reductions along axes
+(a - dark)/flat                       # broadcasting against errarray's, errval's, numbers
+
+Like errvallist, an errarray keeps two numpy.ndarrays (values and errors) of the same shape.
+Indexing, slicing, reshape and transpose follow numpy:
+they return views sharing the value and error buffers wherever numpy does,
+so writing into a view changes the original.
+errarray(errvallist) shares the buffers of the list, as_errvallist() goes back.
+'''
+
+import numpy as np
+
+from errval import *
+from errvallist import *
+from errvallist import _add, _sub, _mul, _div, _pow, _sqrt, _exp, _log
+
+
+def _columns(x):
+    '''
+    value, error and printout of an errval, errvallist or errarray
+    (the arrays themselves, not copies);
+    anything else is taken as exact: (float64 array, None, None)
+    '''
+    if isinstance(x,errval):
+        return x.val(), x.err(), x.printout()
+    if isinstance(x,(errvallist,errarray)):
+        return x.v(), x.e(), x.printout()
+    return np.asarray(x,dtype=np.float64), None, None
+
+def _as_arrays(vals,errs):
+    # values and errors as float64 arrays of the same shape
+    if isinstance(vals,(errarray,errvallist,errval)):
+        v, e, _ = _columns(vals)
+        return np.asarray(v,dtype=np.float64), np.asarray(e,dtype=np.float64)
+    if isinstance(vals,(list,tuple)) and len(vals)>0 \
+            and all([isinstance(x,(errval,errvallist,errarray)) for x in vals]):
+        # stack of errval's/errvallist's/errarray's
+        parts = [_as_arrays(x,0) for x in vals]
+        return np.array([p[0] for p in parts]), np.array([p[1] for p in parts])
+    v = np.asarray(vals,dtype=np.float64)
+    e = np.asarray(errs,dtype=np.float64)
+    if v.shape!=e.shape:
+        v, e = [np.ascontiguousarray(x) for x in np.broadcast_arrays(v,e)]
+    with np.errstate(invalid='ignore'): # nan errors are fine
+        if np.any(e<0):
+            raise ValueError, 'Cannot assign negative error'
+    return v, e
+
+
+class errarray(object):
+    __array_priority__ = 100
+
+    def __init__(self,vals,errs=0,printout='latex'):
+        '''
+        vals = values (array-like), or an errarray, errvallist or errval
+            (whose buffers are shared, errs is ignored then),
+            or a list of these (stacked along a new first axis)
+        errs = errors, broadcast against vals
+        '''
+        if isinstance(vals,(errarray,errvallist,errval)):
+            printout = vals.printout()
+        elif isinstance(vals,(list,tuple)) and len(vals)>0 and isinstance(vals[0],(errval,errvallist,errarray)):
+            printout = vals[0].printout()
+        self.__v, self.__e = _as_arrays(vals,errs)
+        self.__printout = printout
+
+    @classmethod
+    def _from_arrays(cls,v,e,printout='latex'):
+        # internal constructor: v and e are trusted float64 arrays of the same shape
+        new = cls.__new__(cls)
+        new.__v, new.__e, new.__printout = v, e, printout
+        return new
+
+    def _new_like(self,v,e):
+        return errarray._from_arrays(v,e,self.__printout)
+
+    def _result(self,v,e):
+        # 0-d results are errval's, as with numpy scalars
+        if np.ndim(v)==0:
+            return errval._new(np.float64(v),np.float64(e),self.__printout)
+        return self._new_like(v,e)
+
+    def printout(self,change=''):
+        if change!='':
+            self.__printout = change
+        return self.__printout
+
+    # the underlying arrays, not copies
+    def v(self): return self.__v
+    def val(self): return self.v()
+    def vals(self): return self.v()
+    def values(self): return self.v()
+
+    def e(self): return self.__e
+    def err(self): return self.e()
+    def errs(self): return self.e()
+    def errors(self): return self.e()
+
+    @property
+    def shape(self): return self.__v.shape
+    @property
+    def ndim(self): return self.__v.ndim
+    @property
+    def size(self): return self.__v.size
+    def __len__(self):
+        if self.ndim==0: raise TypeError, 'len() of a 0-d errarray'
+        return len(self.__v)
+
+    def __str__(self):
+        # formatted from the arrays, nested like numpy
+        import formatting
+        cells = np.array(formatting.format_errvals(self),dtype=object).reshape(self.shape)
+        def nested(c):
+            if c.ndim==1: return '['+','.join(c)+']'
+            return '['+','.join([nested(x) for x in c])+']'
+        return cells[()] if self.ndim==0 else nested(cells)
+    def __repr__(self):
+        return 'errarray({0})'.format(self)
+
+    '''
+    Indexing and shape, views wherever numpy gives views
+    '''
+    def __getitem__(self,key):
+        return self._result(self.__v[key],self.__e[key])
+    def __setitem__(self,key,value):
+        v, e = _as_arrays(value,0)
+        self.__v[key], self.__e[key] = v, e
+
+    def __iter__(self):
+        # along the first axis
+        for j in xrange(len(self)):
+            yield self[j]
+
+    def reshape(self,*shape):
+        return self._new_like(self.__v.reshape(*shape),self.__e.reshape(*shape))
+    def ravel(self):
+        return self._new_like(self.__v.ravel(),self.__e.ravel())
+    def transpose(self,*axes):
+        return self._new_like(self.__v.transpose(*axes),self.__e.transpose(*axes))
+    @property
+    def T(self): return self.transpose()
+    def swapaxes(self,axis1,axis2):
+        return self._new_like(self.__v.swapaxes(axis1,axis2),self.__e.swapaxes(axis1,axis2))
+    def squeeze(self,axis=None):
+        return self._new_like(self.__v.squeeze(axis),self.__e.squeeze(axis))
+    def copy(self):
+        return self._new_like(self.__v.copy(),self.__e.copy())
+
+    def as_errvallist(self):
+        # one-dimensional errarray as errvallist, sharing the buffers
+        if self.ndim!=1:
+            raise ValueError, 'Cannot convert errarray of shape {0} to errvallist'.format(self.shape)
+        return errvallist._from_arrays(self.__v,self.__e,self.__printout)
+
+    '''
+    Arithmetic with numpy broadcasting,
+    against errarray's, errvallist's, errval's, numbers and arrays of numbers;
+    add, sub, mul, div and pow take out = errarray, as errvallist does
+    (+=, -=, ... write into self).
+    '''
+    def _operand(self,other,op):
+        if isinstance(other,(errarray,errvallist,errval)):
+            return _as_arrays(other,0)
+        if isinstance(other,(int,float,long)):
+            return other, 0
+        if isinstance(other,(list,tuple,np.ndarray)):
+            try:
+                return np.asarray(other,dtype=np.float64), 0
+            except (ValueError,TypeError):
+                return _as_arrays(other,0)
+        raise TypeError, 'unsupported operand type(s) for {0}: errarray with {1}'.format(op,type(other))
+
+    def _out(self,out,*operands):
+        # the buffers to write the result into, of the broadcast shape
+        if out is None:
+            shape = np.broadcast(*operands).shape
+            out = self._new_like(np.empty(shape),np.empty(shape))
+        elif not isinstance(out,errarray):
+            raise ValueError, 'out has to be an errarray'
+        return out, out.v(), out.e()
+
+    def _binary(self,kernel,other,op,out,reflected=False):
+        ov, oe = self._operand(other,op)
+        out, v, e = self._out(out,self.__v,ov)
+        if reflected: kernel(ov,oe,self.__v,self.__e,v,e)
+        else: kernel(self.__v,self.__e,ov,oe,v,e)
+        return self._result(v,e) if out.ndim==0 else out
+
+    def add(self,other,out=None):
+        return self._binary(_add,other,'+',out)
+    def sub(self,other,out=None,reflected=False):
+        return self._binary(_sub,other,'-',out,reflected)
+    def mul(self,other,out=None):
+        return self._binary(_mul,other,'*',out)
+    def div(self,other,out=None,reflected=False):
+        return self._binary(_div,other,'/',out,reflected)
+    def pow(self,other,out=None,reflected=False):
+        return self._binary(_pow,other,'**',out,reflected)
+
+    def _operator(self,method,other,*args):
+        # NotImplemented for unknown operands, python then tries other's reflected operator
+        if not isinstance(other,(errarray,errvallist,errval,int,float,long,list,tuple,np.ndarray)):
+            return NotImplemented
+        return method(other,*args)
+
+    def __add__(self,other): return self._operator(self.add,other)
+    def __radd__(self,other): return self._operator(self.add,other)
+    def __iadd__(self,other): return self._operator(self.add,other,self)
+    def __sub__(self,other): return self._operator(self.sub,other)
+    def __rsub__(self,other): return self._operator(self.sub,other,None,True)
+    def __isub__(self,other): return self._operator(self.sub,other,self)
+    def __mul__(self,other): return self._operator(self.mul,other)
+    def __rmul__(self,other): return self._operator(self.mul,other)
+    def __imul__(self,other): return self._operator(self.mul,other,self)
+    def __div__(self,other): return self._operator(self.div,other)
+    def __rdiv__(self,other): return self._operator(self.div,other,None,True)
+    def __idiv__(self,other): return self._operator(self.div,other,self)
+    def __truediv__(self,other): return self.__div__(other)
+    def __rtruediv__(self,other): return self.__rdiv__(other)
+    def __itruediv__(self,other): return self.__idiv__(other)
+    def __pow__(self,other): return self._operator(self.pow,other)
+    def __rpow__(self,other): return self._operator(self.pow,other,None,True)
+    def __ipow__(self,other): return self._operator(self.pow,other,self)
+
+    def __neg__(self): return self._new_like(-self.__v,self.__e.copy())
+    def __pos__(self): return self
+    def __abs__(self): return self._new_like(np.abs(self.__v),self.__e.copy())
+
+    def _unary(self,kernel,out,*args):
+        out, v, e = self._out(out,self.__v)
+        kernel(self.__v,self.__e,v,e,*args)
+        return self._result(v,e) if out.ndim==0 else out
+
+    def sqrt(self,out=None): return self._unary(_sqrt,out)
+    def exp(self,out=None): return self._unary(_exp,out)
+    def log(self,out=None): return self._unary(_log,out)
+    def log10(self,out=None): return self._unary(_log,out,np.log10,1.0/np.log(10))
+    def log2(self,out=None): return self._unary(_log,out,np.log2,1.0/np.log(2))
+
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        # numpy.exp(errarray) & co.; see ufuncs.py
+        import ufuncs
+        return ufuncs.array_ufunc(ufunc,method,inputs,kwargs)
+
+    '''
+    Reductions along axes (None: all entries), signatures as in numpy;
+    out = errarray of the result shape receives the result
+    '''
+    def _reduced(self,v,e,out):
+        if out is not None:
+            out.v()[...], out.e()[...] = v, e
+            return out
+        return self._result(v,e)
+
+    def sum(self,axis=None,dtype=None,out=None,keepdims=False):
+        v = np.sum(self.__v,axis=axis,keepdims=keepdims)
+        e = np.sqrt(np.sum(self.__e**2,axis=axis,keepdims=keepdims))
+        return self._reduced(v,e,out)
+
+    def mean(self,axis=None,dtype=None,out=None,keepdims=False):
+        v = np.sum(self.__v,axis=axis,keepdims=keepdims)
+        n = self.size/max(np.size(v),1) # entries per result
+        e = np.sqrt(np.sum(self.__e**2,axis=axis,keepdims=keepdims))/n
+        return self._reduced(v/n,e,out)
+
+    def wmean(self,axis=None,keepdims=False):
+        # weighted mean, see errvallist.wmean
+        w = 1.0/self.__e**2
+        sig_x = np.sum(w,axis=axis,keepdims=keepdims)
+        v = np.sum(self.__v*w,axis=axis,keepdims=keepdims)/sig_x
+        return self._reduced(v,1.0/np.sqrt(sig_x),None)
+
+    def cumsum(self,axis=None,dtype=None,out=None):
+        v = np.cumsum(self.__v,axis=axis)
+        e = np.sqrt(np.cumsum(self.__e**2,axis=axis))
+        return self._reduced(v,e,out)
+
+    def argmax(self,axis=None,out=None):
+        # index of the largest value (flat index for axis=None)
+        return np.argmax(self.__v,axis=axis,out=out)
+    def argmin(self,axis=None,out=None):
+        return np.argmin(self.__v,axis=axis,out=out)
+
+    def _pick(self,indices,axis,out,keepdims):
+        # the entries at indices along axis
+        if axis is None:
+            v, e = self.__v.ravel()[indices], self.__e.ravel()[indices]
+            if keepdims: v, e = np.reshape(v,(1,)*self.ndim), np.reshape(e,(1,)*self.ndim)
+        else:
+            indices = np.expand_dims(indices,axis)
+            v = np.take_along_axis(self.__v,indices,axis)
+            e = np.take_along_axis(self.__e,indices,axis)
+            if not keepdims: v, e = v.squeeze(axis), e.squeeze(axis)
+        return self._reduced(v,e,out)
+
+    def max(self,axis=None,out=None,keepdims=False):
+        # the entries with the largest value
+        return self._pick(self.argmax(axis),axis,out,keepdims)
+    def min(self,axis=None,out=None,keepdims=False):
+        return self._pick(self.argmin(axis),axis,out,keepdims)
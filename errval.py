@@ -4,14 +4,52 @@
 '''
 Work with errorbars on your data:
  value +- error
-
-TODO: resolve compatibility issue with __truediv__
 '''
 
-import numpy as np
+import math
+
+
+# the scalar core only needs the math module
+# (numpy is imported on demand, by ufuncs.py when numpy hands an errval to __array_ufunc__);
+# the help functions below follow numpy for the edge cases
+_LN2, _LN10 = math.log(2), math.log(10)
+
+def _log(x,log=math.log):
+    # like numpy.log: log(0) = -inf, log(x<0) = nan
+    if x>0: return log(x)
+    if x==0: return float('-inf')
+    return float('nan')
+
+def _log2(x):
+    # exact for powers of two, like numpy.log2
+    if not x>0 or x==float('inf'): return _log(x)
+    mantissa, exponent = math.frexp(x)
+    if mantissa==0.5: return float(exponent-1)
+    return exponent + math.log(mantissa)/_LN2
+
+def _rint(y):
+    # round half to even, like numpy.rint
+    r = math.floor(y)
+    d = y-r
+    if d>0.5 or (d==0.5 and r%2==1): r += 1
+    return r
+
+def _around(x,n=0):
+    # like numpy.around
+    if isinstance(x,(int,long)) and n>=0: return x
+    if n>=0:
+        f = 10.0**n
+        y = _rint(x*f)/f
+    else:
+        f = 10.0**(-n)
+        y = _rint(x/f)*f
+    return int(y) if isinstance(x,(int,long)) else y
 
 
 class errval(object):
+    # no per-instance __dict__: an errval is just these three fields
+    __slots__ = ('__val','__err','__printout')
+
     def __init__(self,val,err=0,printout='latex'):
         '''
         val = the value (number or errval (see below))
@@ -49,6 +87,20 @@ class errval(object):
         else:
             raise ValueError, 'Cannot assign input data: errval({0},{1})'.format(val,err)
 
+    @classmethod
+    def _new(cls,val,err,printout):
+        # internal constructor for results of operations:
+        # the input is trusted, i.e. no type dispatch and no validation
+        new = object.__new__(cls)
+        new.__val = val
+        new.__err = err
+        new.__printout = printout
+        return new
+
+    def __getstate__(self):
+        return (self.__val,self.__err,self.__printout)
+    def __setstate__(self,state):
+        self.__val, self.__err, self.__printout = state
     
     def val(self):
         return self.__val
@@ -85,95 +137,107 @@ class errval(object):
     
     def __add__(self,other):
         if isinstance(other,errval):
-            nval = self.val() + other.val()
-            nerr = np.sqrt( self.err()**2 + other.err()**2 )
+            nval = self.__val + other.__val
+            nerr = math.sqrt( self.__err**2 + other.__err**2 )
         elif isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = self.val() + other
-            nerr = self.err()
+            nval = self.__val + other
+            nerr = self.__err
         else:
-            raise TypeError, 'unsupported operand type(s) for +: errval with {0}'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            # python then tries the reflected operator of other (e.g. errvallist, lazyval)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
     def __radd__(self,other):
         return self.__add__(other)
     
     def __sub__(self,other):
         if isinstance(other,errval):
-            nval = self.val() - other.val()
-            nerr = np.sqrt( self.err()**2 + other.err()**2 )
+            nval = self.__val - other.__val
+            nerr = math.sqrt( self.__err**2 + other.__err**2 )
         elif isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = self.val() - other
-            nerr = self.err()
+            nval = self.__val - other
+            nerr = self.__err
         else:
-            raise TypeError, 'unsupported operand type(s) for -: errval with {0}'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
     def __rsub__(self,other):
         if isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = other - self.val()
-            nerr = self.err()
+            nval = other - self.__val
+            nerr = self.__err
         else:
-            raise TypeError, 'unsupported operand type(s) for -: {0} with errval'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
         
     def __mul__(self,other):
         if isinstance(other,errval):
-            nval = self.val() * other.val()
-            nerr = np.sqrt( (other.val()*self.err())**2 + (self.val()*other.err())**2 )
+            nval = self.__val * other.__val
+            nerr = math.sqrt( (other.__val*self.__err)**2 + (self.__val*other.__err)**2 )
         elif isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = self.val() * other
-            nerr = self.err() * abs(other)
+            nval = self.__val * other
+            nerr = self.__err * abs(other)
         else:
-            raise TypeError, 'unsupported operand type(s) for *: errval with {0}'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
     def __rmul__(self,other):
         return self.__mul__(other)
     
     def __div__(self,other):
         if isinstance(other,errval):
-            nval = self.val() *1.0 / other.val()
-            nerr = np.sqrt( (1.0/other.val()*self.err())**2 + (self.val()*1.0/(other.val()**2)*other.err())**2 )
+            nval = self.__val *1.0 / other.__val
+            nerr = math.sqrt( (1.0/other.__val*self.__err)**2 + (self.__val*1.0/(other.__val**2)*other.__err)**2 )
         elif isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = self.val() *1.0 / other
-            nerr = self.err() *1.0/ abs(other)
+            nval = self.__val *1.0 / other
+            nerr = self.__err *1.0/ abs(other)
         else:
-            raise TypeError, 'unsupported operand type(s) for /: errval with {0}'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
     def __rdiv__(self,other):
         if isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = other *1.0/self.val()
-            nerr = abs(other)*1.0/self.val()**2 * self.err()
+            nval = other *1.0/self.__val
+            nerr = abs(other)*1.0/self.__val**2 * self.__err
         else:
-            raise TypeError, 'unsupported operand type(s) for /: {0} with errval'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
     
+    # numpy (and 'from __future__ import division') use true division
+    def __truediv__(self,other):
+        return self.__div__(other)
+    def __rtruediv__(self,other):
+        return self.__rdiv__(other)
+
     def __pow__(self,other):
         if isinstance(other,errval):
-            nval = self.val() ** other.val()
-            nerr = np.sqrt( ( other.val() * self.val()**(other.val()-1) * self.err() )**2
-                            + ( np.log(self.val()) * self.val()**other.val() * other.err() )**2 )
+            nval = self.__val ** other.__val
+            nerr = math.sqrt( ( other.__val * self.__val**(other.__val-1) * self.__err )**2
+                            + ( _log(self.__val) * self.__val**other.__val * other.__err )**2 )
         elif isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = self.val() ** other
-            nerr = abs( other * self.val()**(other-1) * self.err() )
+            nval = self.__val ** other
+            nerr = abs( other * self.__val**(other-1) * self.__err )
         else:
-            raise TypeError, 'unsupported operand type(s) for **: errval with {0}'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
     def __rpow__(self,other):
         if isinstance(other,(int,float,long)):
             # a value with zero error attached
-            nval = other ** self.val()
-            nerr = abs( np.log(other) * other**self.val() * self.err() )
+            nval = other ** self.__val
+            nerr = abs( _log(other) * other**self.__val * self.__err )
         else:
-            raise TypeError, 'unsupported operand type(s) for **: errval with {0}'.format(type(other))
-        return errval(nval, nerr, self.__printout)
+            return NotImplemented
+        return errval._new(nval, nerr, self.__printout)
     
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        # numpy.exp(errval) & co.; see ufuncs.py
+        import ufuncs
+        return ufuncs.array_ufunc(ufunc,method,inputs,kwargs)
+
     def __abs__(self):
-        return errval(abs(self.val()), self.err(), self.printout())
+        return errval._new(abs(self.__val), self.__err, self.__printout)
     
     def sqrt(self):
         return self**0.5
@@ -197,25 +261,25 @@ class errval(object):
             \Delta c = \sqrt( (\partial c/\partial b)^2 * (\Delta b)^2 )
                      = \sqrt( (1/ln(a) * 1/b)^2 * (\Delta b)^2 )
         '''
-        c = np.log(self.val())
+        c = _log(self.val())
         dc = abs( self.err()/self.val() )
-        return errval(c,dc,self.printout())
+        return errval._new(c,dc,self.__printout)
     def log10(self):
         '''
         see derivation in log()
         '''
-        c = np.log10(self.val())
-        dc = abs( 1.0/np.log(10) * self.err()/self.val() )
-        return errval(c,dc,self.printout())
+        c = _log(self.val(),math.log10)
+        dc = abs( 1.0/_LN10 * self.err()/self.val() )
+        return errval._new(c,dc,self.__printout)
     def log2(self):
         '''
         see derivation in log()
         '''
-        c = np.log2(self.val())
-        dc = abs( 1.0/np.log(2) * self.err()/self.val() )
-        return errval(c,dc,self.printout())
+        c = _log2(self.val())
+        dc = abs( 1.0/_LN2 * self.err()/self.val() )
+        return errval._new(c,dc,self.__printout)
 
     def round(self,n=0):
         # returns new instance
-        return errval(np.around(self.val(),n),np.around(self.err(),n),self.printout())
+        return errval(_around(self.val(),n),_around(self.err(),n),self.printout())
 
@@ -4,6 +4,11 @@
 '''
 Work with whole lists of errval's:
  [v0+-e0, v1+-e1, ...]
+
+Internally the list is stored column-wise,
+as two contiguous float64 numpy.ndarrays (values and errors).
+All arithmetic runs on these arrays in one go;
+individual errval's are only created when you access an element.
 '''
 
 import numpy as np
@@ -11,113 +16,449 @@ import numpy as np
 from errval import *
 
 
+def _as_columns(vals,errs):
+    # try to interpret input as plain numbers, without going through errval
+    # returns None if that's not possible
+    # (e.g. list of errval's or list of tuples)
+    try:
+        v = np.asarray(vals)
+        e = np.asarray(errs)
+    except (ValueError,TypeError):
+        return None
+    if v.dtype.kind not in 'biuf' or e.dtype.kind not in 'biuf':
+        return None
+    if v.ndim>1 or e.ndim>1:
+        return None
+    if v.ndim==1 and e.ndim==1 and len(v)!=len(e):
+        raise ValueError, 'Cannot assign input data with lengths {0} and {1}'.format(len(v),len(e))
+    v, e = np.broadcast_arrays(v.astype(np.float64),e.astype(np.float64))
+    return np.ascontiguousarray(v), np.ascontiguousarray(e)
+
+
+'''
+The arithmetic kernels, on plain value and error arrays (or numbers):
+a, b = the operands, v, e = the buffers receiving the result,
+which may be the ones of an operand (in-place), as the operands are only read
+before the same entry of the result is written.
+An error 0 (number) marks an exact operand, such operands take a shortcut.
+'''
+def _exact(e):
+    return np.ndim(e)==0 and e==0
+
+def _add(av,ae,bv,be,v,e):
+    np.hypot(ae,be,out=e)
+    np.add(av,bv,out=v)
+
+def _sub(av,ae,bv,be,v,e):
+    np.hypot(ae,be,out=e)
+    np.subtract(av,bv,out=v)
+
+def _mul(av,ae,bv,be,v,e):
+    if _exact(be) or _exact(ae):
+        if _exact(ae): (av,ae), (bv,be) = (bv,be), (av,ae)
+        np.multiply(ae,bv,out=e)
+        np.absolute(e,out=e)
+    else:
+        scratch = np.multiply(ae,bv)
+        np.multiply(av,be,out=e)
+        np.hypot(scratch,e,out=e)
+    np.multiply(av,bv,out=v)
+
+def _div(av,ae,bv,be,v,e):
+    if _exact(be):
+        np.divide(ae,bv,out=e)
+        np.absolute(e,out=e)
+        np.divide(av,bv,out=v)
+    elif _exact(ae):
+        # only the denominator contributes, |v*be/bv|
+        np.divide(be,bv,out=e)
+        np.divide(av,bv,out=v)
+        np.multiply(e,v,out=e)
+        np.absolute(e,out=e)
+    else:
+        # sqrt( (ae/bv)**2 + (av/bv**2*be)**2 ) = hypot(ae, v*be)/|bv|
+        quotient = np.divide(av,bv)
+        scratch = np.multiply(quotient,be)
+        np.hypot(ae,scratch,out=scratch)
+        np.divide(scratch,bv,out=e)
+        np.absolute(e,out=e)
+        v[...] = quotient
+
+def _pow(av,ae,bv,be,v,e):
+    import ufuncs
+    # exact operands don't contribute, also where their log isn't defined
+    f, df = ufuncs.propagate(np.power,[av,bv],[None if _exact(ae) else ae,None if _exact(be) else be])
+    v[...], e[...] = f, df
+
+# the error only needs either the input or the result, so in-place works without scratch
+def _sqrt(av,ae,v,e):
+    np.sqrt(av,out=v)
+    np.divide(ae,v,out=e)
+    e *= 0.5
+
+def _exp(av,ae,v,e):
+    np.exp(av,out=v)
+    np.multiply(ae,v,out=e)
+
+def _log(av,ae,v,e,log=np.log,factor=1):
+    # error first, it needs the input
+    np.divide(ae,av,out=e)
+    np.absolute(e,out=e)
+    if factor!=1: e *= factor
+    log(av,out=v)
+
+
 class errvallist(list):
     def __init__(self,vals=[],errs=0,printout='latex'):
+        self.__printout = printout
         if isinstance(vals,errvallist):
-            self.__errl = vals
-        elif isinstance(vals,(list,np.ndarray)) or isinstance(errs,(list,np.ndarray)):
-            if isinstance(vals,(list,np.ndarray)) and isinstance(errs,(list,np.ndarray)):
-                if len(vals)==len(errs):
-                    self.__errl = [errval(vals[j],errs[j],printout) for j in xrange(len(vals))]
-            elif isinstance(vals,(list,np.ndarray)) and isinstance(errs,(int,float,long)):
-                # note: this also covers the case vals is a list of errval entries,
-                # in this case the errs are ignored and the result is a conversion of list to errvallist
-                self.__errl = [errval(v,errs,printout) for v in vals]
-            elif isinstance(vals,(int,float,long)) and isinstance(errs,(list,np.ndarray)):
-                self.__errl = [errval(vals,e,printout) for e in errs]
-        else:
+            # a copy, like list(l)
+            self.__v, self.__e = vals.v().copy(), vals.e().copy()
+            self.__printout = vals.printout()
+            return
+        if not ( isinstance(vals,(list,tuple,np.ndarray)) or isinstance(errs,(list,tuple,np.ndarray)) ):
             raise ValueError, 'Cannot assign input data: {0}'.format(type(vals))
+        if not isinstance(vals,(list,tuple,np.ndarray,int,float,long)) or \
+            not isinstance(errs,(list,tuple,np.ndarray,int,float,long)):
+            raise ValueError, 'Cannot assign input data: errvallist({0},{1})'.format(type(vals),type(errs))
+
+        columns = _as_columns(vals,errs)
+        if columns is None:
+            # general case: each entry knows how to become an errval
+            # (errval, tuple, number); the errs are ignored for errval entries
+            if isinstance(errs,(list,tuple,np.ndarray)):
+                if len(vals)!=len(errs):
+                    raise ValueError, 'Cannot assign input data with lengths {0} and {1}'.format(len(vals),len(errs))
+                evs = [errval(vals[j],errs[j],printout) for j in xrange(len(vals))]
+            else:
+                evs = [errval(v,errs,printout) for v in vals]
+            if len(evs)>0 and isinstance(vals[0],(errval,tuple)):
+                # the list takes the printout of its first entry
+                self.__printout = evs[0].printout()
+            columns = ( np.array([ev.val() for ev in evs],dtype=np.float64),
+                        np.array([ev.err() for ev in evs],dtype=np.float64) )
+        else:
+            with np.errstate(invalid='ignore'): # nan errors are fine
+                if np.any(columns[1]<0):
+                    raise ValueError, 'Cannot assign negative error'
+        self.__v, self.__e = columns
+
+    @classmethod
+    def _from_arrays(cls,v,e,printout='latex'):
+        # internal constructor: v and e are trusted float64 arrays of equal length
+        # no validation, no copy
+        new = cls.__new__(cls)
+        new.__v, new.__e, new.__printout = v, e, printout
+        return new
+
+    def _new_like(self,v,e):
+        return errvallist._from_arrays(v,e,self.__printout)
+
+    def printout(self,change=''):
+        if change!='':
+            self.__printout = change
+        return self.__printout
 
     def __getitem__(self,key):
-        return self.__errl[key]
+        if isinstance(key,slice):
+            # a copy, like l[i:j] of a list (numpy would give a view)
+            return self._new_like(self.__v[key].copy(),self.__e[key].copy())
+        if isinstance(key,(list,np.ndarray)):
+            return self._new_like(self.__v[key],self.__e[key])
+        return errval._new(self.__v[key],self.__e[key],self.__printout)
     def __setitem__(self,key,value):
-        self.__errl[key]=value
+        if isinstance(value,errval):
+            self.__v[key], self.__e[key] = value.val(), value.err()
+        elif isinstance(value,errvallist):
+            self.__v[key], self.__e[key] = value.v(), value.e()
+        else:
+            value = errval(value)
+            self.__v[key], self.__e[key] = value.val(), value.err()
 
     def __getslice__(self,i,j):
         # https://docs.python.org/2/reference/datamodel.html#object.__getslice__
         # Deprecated since version 2.0
         # but since I derive from list I have to ignore this deprecation...
-        return errvallist(self.__errl[i:j])
+        return self.__getitem__(slice(i,j))
+    def __setslice__(self,i,j,value):
+        self.__setitem__(slice(i,j),value)
 
     def __str__(self):
-        outp = '['
-        for evl in self.__errl:
-            outp += evl.__str__()+','
-        outp = outp[:-1]+']'
-        return outp
-    
+        # formatted from the arrays, without an errval per entry
+        import formatting
+        return '['+','.join(formatting.format_errvals(self))+']'
+    def __repr__(self):
+        return 'errvallist({0!r},{1!r},{2!r})'.format(self.__v.tolist(),self.__e.tolist(),self.__printout)
+
+    def __reduce__(self):
+        # copy, deepcopy and pickle go through the columns;
+        # the default protocol of list subclasses would read the (empty) list itself and the state
+        return (errvallist,(self.__v.copy(),self.__e.copy(),self.__printout))
+
     def __iter__(self):
         # to make the errvallist iterable
         # i.e. to make the 'in' possible in 'for err in errvallist:'
-        for err in self.__errl:
-            yield err
+        for j in xrange(len(self.__v)):
+            yield errval._new(self.__v[j],self.__e[j],self.__printout)
 
     def __len__(self):
-        return len(self.__errl)
+        return len(self.__v)
+
+    def _operand(self,other,op):
+        # bring the other operand into column form: (values, errors)
+        if isinstance(other,errvallist):
+            if len(other)!=len(self):
+                raise TypeError, 'unsupported operand for {0}: errvallists of length {1} and {2}'.format(op,len(self),len(other))
+            return other.v(), other.e()
+        if isinstance(other,errval):
+            return other.val(), other.err()
+        if isinstance(other,(int,float,long)):
+            # a value with zero error attached
+            return other, 0
+        if isinstance(other,(list,np.ndarray)) and len(other)==len(self):
+            return self._operand(errvallist(other),op)
+        raise TypeError, 'unsupported operand type(s) for {0}: errvallist with {1}'.format(op,type(other))
+
+    '''
+    Arithmetic on the columns.
+    add, sub, mul, div and pow take an optional out = errvallist (of the same length)
+    whose value and error buffers receive the result, e.g. out=self;
+    the in-place operators (+=, -=, ...) do exactly that;
+    slices and errvallist(l) are copies, so this never reaches into another list.
+    Without out, the result gets fresh buffers.
+    '''
+    def _out(self,out):
+        # the buffers to write the result into
+        if out is None:
+            out = self._new_like(np.empty(len(self)),np.empty(len(self)))
+        elif not isinstance(out,errvallist) or len(out)!=len(self):
+            raise ValueError, 'out has to be an errvallist of length {0}'.format(len(self))
+        return out, out.v(), out.e()
+
+    def add(self,other,out=None):
+        ov, oe = self._operand(other,'+')
+        out, v, e = self._out(out)
+        _add(self.__v,self.__e,ov,oe,v,e)
+        return out
+
+    def sub(self,other,out=None,reflected=False):
+        # reflected: other - self
+        ov, oe = self._operand(other,'-')
+        out, v, e = self._out(out)
+        if reflected: _sub(ov,oe,self.__v,self.__e,v,e)
+        else: _sub(self.__v,self.__e,ov,oe,v,e)
+        return out
+
+    def mul(self,other,out=None):
+        ov, oe = self._operand(other,'*')
+        out, v, e = self._out(out)
+        _mul(self.__v,self.__e,ov,oe,v,e)
+        return out
+
+    def div(self,other,out=None,reflected=False):
+        # reflected: other / self
+        ov, oe = self._operand(other,'/')
+        out, v, e = self._out(out)
+        if reflected: _div(ov,oe,self.__v,self.__e,v,e)
+        else: _div(self.__v,self.__e,ov,oe,v,e)
+        return out
+
+    def pow(self,other,out=None,reflected=False):
+        # reflected: other ** self
+        ov, oe = self._operand(other,'**')
+        out, v, e = self._out(out)
+        if reflected: _pow(ov,oe,self.__v,self.__e,v,e)
+        else: _pow(self.__v,self.__e,ov,oe,v,e)
+        return out
+
+    def _operator(self,method,other,*args):
+        # unknown operands give NotImplemented, such that python tries
+        # the reflected operator of other (errarray, lazyval, ...)
+        if not isinstance(other,(errvallist,errval,int,float,long,list,np.ndarray)):
+            return NotImplemented
+        return method(other,*args)
 
     def __add__(self,other):
-        if isinstance(other,(errvallist,list)) and len(self)==len(other):
-             errvall = [self[j]+other[j] for j in xrange(len(self))]
-        elif isinstance(other,(int,float,long,errval)):
-            errvall = [s+other for s in self]
-        else:
-            raise TypeError, 'unsupported operand type(s) for +: errval with {0}'.format(type(other))
-        return errvallist(errvall)
+        return self._operator(self.add,other)
     def __radd__(self,other):
-            return self.__add__(other)
+        return self._operator(self.add,other)
+    def __iadd__(self,other):
+        return self._operator(self.add,other,self)
 
     def __sub__(self,other):
-        if isinstance(other,(errvallist,list)) and len(self)==len(other):
-            errvall = [self[j]-other[j] for j in xrange(len(self))]
-        elif isinstance(other,(int,float,long,errval)):
-            errvall = [s-other for s in self]
-        else:
-            raise TypeError, 'unsupported operand type(s) for -: errval with {0}'.format(type(other))
-        return errvallist(errvall)
+        return self._operator(self.sub,other)
     def __rsub__(self,other):
-        return -1*self.__sub__(other)
+        return self._operator(self.sub,other,None,True)
+    def __isub__(self,other):
+        return self._operator(self.sub,other,self)
 
     def __mul__(self,other):
-        if isinstance(other,(errvallist,list)) and len(self)==len(other):
-            errvall = [self[j]*other[j] for j in xrange(len(self))]
-        elif isinstance(other,(int,float,long,errval)):
-            errvall = [s*other for s in self]
-        else:
-            raise TypeError, 'unsupported operand type(s) for *: errval with {0}'.format(type(other))
-        return errvallist(errvall)
+        return self._operator(self.mul,other)
     def __rmul__(self,other):
-        return self.__mul__(other)
+        return self._operator(self.mul,other)
+    def __imul__(self,other):
+        return self._operator(self.mul,other,self)
 
     def __div__(self,other):
-        if isinstance(other,(errvallist,list)) and len(self)==len(other):
-            errvall = [self[j]/other[j] for j in xrange(len(self))]
-        elif isinstance(other,(int,float,long,errval)):
-            errvall = [s/other for s in self]
-        else:
-            raise TypeError, 'unsupported operand type(s) for /: errval with {0}'.format(type(other))
-        return errvallist(errvall)
+        return self._operator(self.div,other)
     def __rdiv__(self,other):
-        return 1.0/self.__div__(other)
+        return self._operator(self.div,other,None,True)
+    def __idiv__(self,other):
+        return self._operator(self.div,other,self)
+
+    # numpy (and 'from __future__ import division') use true division
+    def __truediv__(self,other):
+        return self.__div__(other)
+    def __rtruediv__(self,other):
+        return self.__rdiv__(other)
+    def __itruediv__(self,other):
+        return self.__idiv__(other)
+
+    def __pow__(self,other):
+        return self._operator(self.pow,other)
+    def __rpow__(self,other):
+        return self._operator(self.pow,other,None,True)
+    def __ipow__(self,other):
+        return self._operator(self.pow,other,self)
+
+    '''
+    Math functions, with optional out (see above).
+    '''
+    def sqrt(self,out=None):
+        out, v, e = self._out(out)
+        _sqrt(self.__v,self.__e,v,e)
+        return out
+    def exp(self,out=None):
+        out, v, e = self._out(out)
+        _exp(self.__v,self.__e,v,e)
+        return out
+    def log(self,out=None):
+        out, v, e = self._out(out)
+        _log(self.__v,self.__e,v,e)
+        return out
+    def log10(self,out=None):
+        out, v, e = self._out(out)
+        _log(self.__v,self.__e,v,e,np.log10,1.0/np.log(10))
+        return out
+    def log2(self,out=None):
+        out, v, e = self._out(out)
+        _log(self.__v,self.__e,v,e,np.log2,1.0/np.log(2))
+        return out
+
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        # numpy.exp(errvallist) & co.; see ufuncs.py
+        import ufuncs
+        return ufuncs.array_ufunc(ufunc,method,inputs,kwargs)
+    def __array_function__(self,func,types,args,kwargs):
+        # numpy.sum(errvallist) & co. (numpy>=1.17); see ufuncs.py
+        import ufuncs
+        return ufuncs.array_function(func,types,args,kwargs)
 
     def append(self,value):
-        self.__errl.append(value)
-        
-    def round(self,n=0):
-        # returns new instance
-        return errvallist([errv.round(n) for errv in self])
+        # every append reallocates the columns;
+        # to build a long list collect the entries first and convert once
+        value = errval(value)
+        self.__v = np.append(self.__v,value.val())
+        self.__e = np.append(self.__e,value.err())
+
+    def _sortkey(self,by):
+        if by in ('value','v'): return self.__v
+        if by in ('error','e'): return self.__e
+        raise ValueError, 'Cannot sort by {0}, choose value or error'.format(by)
+
+    def argsort(self,by='value',reverse=False):
+        # indices that sort the list; stable, i.e. ties keep their order
+        key = self._sortkey(by)
+        if reverse: key = -key
+        return np.argsort(key,kind='mergesort')
+
+    def sort(self,by=None,reverse=False,key=None,cmp=None):
+        # in-place, like list.sort(): by = 'value' (default) or 'error' sorts that column,
+        # cmp and key work as with list.sort, on the errval entries
+        if cmp is None and key is None:
+            order = self.argsort(by or 'value',reverse)
+        elif by is not None:
+            raise ValueError, 'Cannot sort by {0} and with cmp or key at once'.format(by)
+        else:
+            entries = list(self)
+            order = sorted(xrange(len(entries)),cmp=cmp,reverse=reverse,
+                           key=(lambda j: entries[j]) if key is None else (lambda j: key(entries[j])))
+        self.__v, self.__e = self.__v[order], self.__e[order]
+
+    def take(self,indices):
+        # returns new instance with the entries at indices
+        indices = np.asarray(indices,dtype=np.intp)
+        return self._new_like(self.__v[indices],self.__e[indices])
+
+    '''
+    Reductions, computed on the columns.
+    The signatures follow numpy, such that np.sum(errvallist) & co. end up here;
+    an errvallist is one-dimensional, so the only sensible axis is 0.
+    '''
+    def _reduction(self,axis,out=None):
+        if axis not in (None,0,-1):
+            raise ValueError, 'errvallist is one-dimensional, cannot reduce along axis {0}'.format(axis)
+        if out is not None:
+            raise TypeError, 'errvallist reductions do not support out'
+
+    def sum(self,axis=None,dtype=None,out=None,keepdims=False):
+        self._reduction(axis,out)
+        return errval._new(np.sum(self.__v),np.sqrt(np.sum(self.__e**2)),self.__printout)
+
+    def mean(self,axis=None,dtype=None,out=None,keepdims=False):
+        self._reduction(axis,out)
+        n = len(self)
+        return errval._new(np.sum(self.__v)/n,np.sqrt(np.sum(self.__e**2))/n,self.__printout)
+
+    def wmean(self,axis=None):
+        '''
+        weighted mean
+
+        sigma_<x>^2 = sum(1/sigma_i^2)
+        <x> = sum(x_i/sigma_i^2)/sigma_<x>^2
+        '''
+        self._reduction(axis)
+        w = 1.0/self.__e**2
+        sig_x = np.sum(w)
+        return errval._new(np.sum(self.__v*w)/sig_x,1.0/np.sqrt(sig_x),self.__printout)
+
+    def cumsum(self,axis=None,dtype=None,out=None):
+        self._reduction(axis,out)
+        return self._new_like(np.cumsum(self.__v),np.sqrt(np.cumsum(self.__e**2)))
+
+    def argmax(self,axis=None,out=None):
+        # index of the largest value
+        self._reduction(axis,out)
+        return int(np.argmax(self.__v))
+    def argmin(self,axis=None,out=None):
+        self._reduction(axis,out)
+        return int(np.argmin(self.__v))
+
+    def max(self,axis=None,out=None,keepdims=False):
+        # the entry with the largest value
+        return self[self.argmax(axis,out)]
+    def min(self,axis=None,out=None,keepdims=False):
+        return self[self.argmin(axis,out)]
+
+    def round(self,n=0,out=None):
+        # returns new instance (or out)
+        out, v, e = self._out(out)
+        np.around(self.__v,n,out=v)
+        np.around(self.__e,n,out=e)
+        return out
 
     '''
     Depending on the circumstances the code incorporating this class
     may want to use different names for the following functions:
+    (these return the underlying arrays, not copies)
     '''
-    def v(self): return np.array([ev.val() for ev in self])
+    def v(self): return self.__v
     def val(self): return self.v()
     def vals(self): return self.v()
     def values(self): return self.v()
 
-    def e(self): return np.array([ev.err() for ev in self])
+    def e(self): return self.__e
     def err(self): return self.e()
     def errs(self): return self.e()
     def errors(self): return self.e()
 
-
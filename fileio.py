@@ -0,0 +1,156 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Read and write (large amounts of) errval's.
+
+Text: the copy-paste printouts of errval,
+ errval(v,e)            printout 'cp'
+ errval(v,e,errvalmode) printout 'cpp'
+are parsed chunk by chunk straight into the value and error arrays of an errvallist,
+so reading a file never holds more than one chunk of text in memory.
+
+Binary: a small header followed by the raw float64 columns
+ magic | header length | header | values | errors
+such that load_errvallist() can memory-map the file
+and hand the columns to an errvallist without copying them.
+'''
+
+import re
+import ast
+import struct
+import numpy as np
+
+from errval import *
+from errvallist import *
+
+
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?(?:nan|inf)'
+_ERRVAL = re.compile(r'errval\(\s*({0})\s*,\s*({0})\s*(,\s*errvalmode\s*)?\)'.format(_NUMBER))
+_MAXTOKEN = 256 # longer than any errval(v,e,errvalmode) we write
+
+_TEMPLATES = {'cp': 'errval(%r,%r)',
+              'cpp': 'errval(%r,%r,errvalmode)'}
+
+
+def _parse(text):
+    '''
+    find all errval(v,e) and errval(v,e,errvalmode) in text
+    returns values, errors (as arrays) and whether errvalmode was encountered
+    '''
+    matches = _ERRVAL.findall(text)
+    if not matches:
+        return np.zeros(0), np.zeros(0), False
+    vals, errs, modes = zip(*matches)
+    # let numpy do the string to float conversion, in one go
+    v = np.fromstring(' '.join(vals),sep=' ')
+    e = np.fromstring(' '.join(errs),sep=' ')
+    return v, e, any(modes)
+
+def _as_errvallist(v,e,modes,printout):
+    with np.errstate(invalid='ignore'):
+        if np.any(e<0): raise ValueError, 'Cannot assign negative error'
+    if printout is None: printout = 'cpp' if modes else 'cp'
+    return errvallist._from_arrays(v,e,printout)
+
+def parse_errvals(text,allow_errvalmode=True,printout=None):
+    '''
+    errvallist of all errval(v,e) (and errval(v,e,errvalmode)) found in a string
+    allow_errvalmode = False raises a ValueError if errval(v,e,errvalmode) is encountered
+    printout = see read_errvals()
+    '''
+    v, e, modes = _parse(text)
+    if modes and not allow_errvalmode:
+        raise ValueError, 'Cannot convert errval(v,e,errvalmode), errvalmode is not known here'
+    return _as_errvallist(v,e,modes,printout)
+
+def read_errvals(fh,chunksize=1<<20,printout=None):
+    '''
+    read all errval(v,e) and errval(v,e,errvalmode) from a file
+    fh = file handle or path
+    chunksize = number of characters read at a time
+    printout = printout of the resulting errvallist;
+        None: 'cpp' if errvalmode was encountered, 'cp' otherwise
+    '''
+    if isinstance(fh,basestring):
+        with open(fh) as f:
+            return read_errvals(f,chunksize,printout)
+    vals, errs = [], []
+    modes = False
+    carry = ''
+    while True:
+        chunk = fh.read(chunksize)
+        text = carry + chunk
+        v, e, m = _parse(text)
+        vals.append(v)
+        errs.append(e)
+        modes = modes or m
+        if not chunk: break
+        # keep what may be the beginning of an errval cut off by the chunk boundary;
+        # every complete errval ends with a ')', so it can't be in there
+        carry = text[max(text.rfind(')')+1,len(text)-_MAXTOKEN):]
+    return _as_errvallist(np.concatenate(vals),np.concatenate(errs),modes,printout)
+
+def write_errvals(fh,evl,printout='cp',sep='\n',chunksize=65536):
+    '''
+    write an errvallist as errval(v,e) ('cp') or errval(v,e,errvalmode) ('cpp'),
+    one per sep, such that read_errvals() gets back the exact same numbers
+    fh = file handle or path
+    '''
+    if printout not in _TEMPLATES:
+        raise ValueError, 'Cannot write printout {0}, choose one of {1}'.format(printout,sorted(_TEMPLATES))
+    if isinstance(fh,basestring):
+        with open(fh,'w') as f:
+            return write_errvals(f,evl,printout,sep,chunksize)
+    if not isinstance(evl,errvallist): evl = errvallist(evl)
+    template = _TEMPLATES[printout] + sep.replace('%','%%')
+    v, e = evl.v(), evl.e()
+    for start in xrange(0,len(v),chunksize):
+        # %r of a float is the shortest string that reads back to the same float
+        rows = zip(v[start:start+chunksize].tolist(),e[start:start+chunksize].tolist())
+        fh.write(''.join([template % row for row in rows]))
+
+
+# -----------------------------------------------------------------------
+
+_MAGIC = '\x93ERRVAL\x01' # format version 1
+_ALIGN = 64 # the columns start at a multiple of this
+
+def save_errvallist(path,evl):
+    '''
+    write an errvallist in binary form, see load_errvallist()
+    '''
+    if not isinstance(evl,errvallist): evl = errvallist(evl)
+    header = repr({'n': len(evl), 'dtype': '<f8', 'printout': evl.printout()})
+    prefix = len(_MAGIC) + 4
+    header += ' '*(-(prefix+len(header)) % _ALIGN)
+    with open(path,'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<I',len(header)))
+        f.write(header)
+        for column in (evl.v(),evl.e()):
+            np.ascontiguousarray(column,dtype='<f8').tofile(f)
+
+def _read_header(f):
+    if f.read(len(_MAGIC))!=_MAGIC:
+        raise ValueError, '{0} is not an errvallist file'.format(f.name)
+    length, = struct.unpack('<I',f.read(4))
+    header = ast.literal_eval(f.read(length))
+    return header, len(_MAGIC)+4+length
+
+def load_errvallist(path,mmap_mode='r'):
+    '''
+    read an errvallist written by save_errvallist()
+    mmap_mode = 'r', 'r+', 'c' (see numpy.memmap): the columns stay on disk and
+        are paged in as needed, the file opens instantly no matter its size,
+        and several processes can share the same data
+        None: read everything into memory
+    '''
+    with open(path,'rb') as f:
+        header, offset = _read_header(f)
+        n = header['n']
+        if mmap_mode is None or n==0:
+            columns = np.fromfile(f,dtype=header['dtype'],count=2*n).reshape(2,n)
+    if mmap_mode is not None and n>0:
+        columns = np.memmap(path,dtype=header['dtype'],mode=mmap_mode,offset=offset,shape=(2,n))
+    return errvallist._from_arrays(columns[0],columns[1],header['printout'])
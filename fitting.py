@@ -0,0 +1,315 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Weighted least squares fits, returning the parameters with errors
+together with their full covariance matrix
+(linreg() returns A and B as independent errval's, their correlation is lost).
+
+Linear models y = sum_j c_j f_j(x):
+polynomials of any degree (f_j = x^j, c_0 first, i.e. A+Bx for degree=1)
+or any basis of functions f_j.
+
+c, cov = linfit(x,y,s,degree=2)    # or y = errvallist, its errors are the s
+c, cov = linfit(x,y,s,basis=[np.ones_like,np.sin,np.cos])
+linfit_eval(x_new,c,cov,degree=2)  # fitted curve, errors from the full covariance
+
+Nonlinear models y = f(x,p0,p1,...) with Levenberg-Marquardt:
+
+def lorentzian(x,x0,gamma,a): return a/(1+((x-x0)/gamma)**2)
+(x0, gamma, a), cov = curvefit(lorentzian,x,y,[1.0,0.1,5.0])       # y = errvallist
+p, cov = curvefit_batch(lorentzian,x,Y,[1.0,0.1,5.0],processes=0)  # Y = series x points
+
+f has to work element-wise with numpy broadcasting:
+the series are fitted all at once, f gets x of shape (1,points)
+and every parameter of shape (series,1).
+The Jacobian is either analytic, jac(x,p0,p1,...) = [df/dp0, df/dp1, ...],
+or from forward differences (one evaluation of f per parameter, for all series at once).
+
+The errors s enter as weights 1/s^2 and are taken as absolute,
+i.e. cov = (A^T W A)^-1, with the design matrix A_ij = f_j(x_i)
+(the Jacobian, for nonlinear models);
+scale_covariance=True scales it with the reduced chi^2 instead
+(for errors that are only known up to a common factor).
+'''
+
+import warnings
+import numpy as np
+
+from errval import *
+from errvallist import *
+from errarray import *
+from errarray import _columns
+from parallel import pool_map
+import ufuncs
+
+
+def design(xi,degree=None,basis=None):
+    '''
+    design matrix (points x parameters) of a linear model
+    degree = polynomial degree (default 1: y=A+Bx), columns x^0, x^1, ...
+    basis = list of functions, each f(xi) gives one column,
+        or a ready-made (points x parameters) array
+    '''
+    xi = np.asarray(xi,dtype=np.float64)
+    if basis is None:
+        return np.vander(xi,(1 if degree is None else degree)+1,increasing=True)
+    if isinstance(basis,np.ndarray):
+        if basis.ndim!=2 or len(basis)!=len(xi):
+            raise ValueError, 'Expected a basis of shape ({0}, parameters), got {1}'.format(len(xi),basis.shape)
+        return np.asarray(basis,dtype=np.float64)
+    return np.column_stack([np.broadcast_to(np.asarray(f(xi),dtype=np.float64),xi.shape) for f in basis])
+
+def _errors(si,overwrite_zeroerrors):
+    '''
+    errors without 0 entries (one series per row)
+    overwrite_zeroerrors as in linreg(): 0.1*min of the nonzero errors of the series
+    '''
+    si = np.array(si,dtype=np.float64,ndmin=2)
+    zero_errors = si==0
+    if np.any(zero_errors):
+        if not overwrite_zeroerrors:
+            raise ValueError, 'This function cannot operate with 0 error entries.'
+        min_valid = np.min(np.where(zero_errors,np.inf,si),axis=1)
+        if np.any(np.isinf(min_valid)):
+            raise ValueError, 'Cannot overwrite 0 errors in a series without any nonzero error.'
+        si = np.where(zero_errors,0.1*min_valid[:,None],si)
+    return si
+
+def _data(yi,si):
+    # values, errors (si if given, otherwise the ones of yi), printout
+    y, e, printout = _columns(yi)
+    if si is not None:
+        e = si
+    if e is None:
+        raise ValueError, 'Plain y values require their errors si'
+    return y, e, printout or 'latex'
+
+def _fit(A,yi,si,scale_covariance):
+    '''
+    one fit per row of yi (series x points), errors si of the same shape,
+    or one row shared by all series
+    returns coefficients (series x parameters) and covariances (series x parameters x parameters)
+    '''
+    n, p = A.shape
+    if n<p:
+        raise ValueError, 'Cannot fit {0} parameters to {1} points'.format(p,n)
+    w = 1.0/si
+    if len(w)==1:
+        # the same weights for all series: one QR factorization of the weighted design matrix
+        Q, R = np.linalg.qr(A*w[0][:,None])
+        c = np.linalg.solve(R,np.dot(Q.T,(yi*w).T)).T
+        Rinv = np.linalg.inv(R)
+        cov = np.broadcast_to(np.dot(Rinv,Rinv.T),(len(yi),p,p))
+    else:
+        # weights per series: normal equations, solved for all series at once
+        w2 = w**2
+        M = np.einsum('sn,np,nq->spq',w2,A,A)
+        c = np.linalg.solve(M,np.einsum('sn,np->sp',w2*yi,A)[...,None])[...,0]
+        cov = np.linalg.inv(M)
+    if scale_covariance:
+        chi2 = np.sum(((yi-np.dot(c,A.T))*w)**2,axis=1)
+        cov = cov*(chi2/max(n-p,1))[:,None,None]
+    return c, cov
+
+def linfit(xi,yi,si=None,degree=None,basis=None,overwrite_zeroerrors=False,scale_covariance=False):
+    '''
+    weighted linear least squares fit
+    xi the x values,
+    yi the y values, errvallist or plain numbers,
+    si the errors of yi (taken from yi if it is an errvallist)
+    degree, basis = the model, see design()
+    overwrite_zeroerrors = see linreg()
+    scale_covariance = True scales the covariance with chi^2/(points-parameters)
+
+    returns errvallist of the coefficients (errors = sqrt of the diagonal of the covariance)
+    and the covariance matrix (parameters x parameters)
+    '''
+    y, s, printout = _data(yi,si)
+    if len(xi)!=len(y):
+        raise ValueError, 'Inputs cannot be brought together with lengths {}, {}'.format(len(xi),len(y))
+    s = _errors(np.broadcast_to(s,np.shape(y)),overwrite_zeroerrors)
+    c, cov = _fit(design(xi,degree,basis),np.atleast_2d(y),s,scale_covariance)
+    return errvallist(c[0],np.sqrt(np.diag(cov[0])),printout), np.array(cov[0])
+
+def linfit_batch(xi,yi,si=None,degree=None,basis=None,overwrite_zeroerrors=False,scale_covariance=False):
+    '''
+    linfit() for many series sharing the same x grid:
+    yi = (series x points) array or errarray,
+    si = errors, either of the same shape or one row shared by all series;
+    with shared errors the weighted design matrix is factorized only once
+    (errors taken from an errarray yi are shared if they are all the same)
+
+    returns errarray of the coefficients (series x parameters)
+    and the covariances (series x parameters x parameters)
+    '''
+    y, s, printout = _data(yi,si)
+    y = np.asarray(y,dtype=np.float64)
+    if y.ndim!=2:
+        raise ValueError, 'Expected a two-dimensional yi (series x points), got shape {}'.format(y.shape)
+    if len(xi)!=y.shape[1]:
+        raise ValueError, 'Inputs cannot be brought together with lengths {}, {}'.format(len(xi),y.shape[1])
+    s = np.asarray(s,dtype=np.float64)
+    if s.ndim==2 and np.all(s==s[:1]):
+        s = s[0]
+    if s.ndim<2:
+        s = np.broadcast_to(s,y.shape[1:])
+    s = _errors(s,overwrite_zeroerrors)
+    c, cov = _fit(design(xi,degree,basis),y,s,scale_covariance)
+    return errarray(c,np.sqrt(np.diagonal(cov,axis1=1,axis2=2)),printout), np.array(cov)
+
+def linfit_eval(xi,coefficients,covariance,degree=None,basis=None):
+    '''
+    the fitted model at xi, with errors from the full covariance
+    (so the correlation of the coefficients is taken into account)
+    coefficients, covariance = result of linfit() (errvallist) or linfit_batch() (errarray)
+
+    returns errvallist (one series) or errarray (series x points)
+    '''
+    A = design(xi,degree,basis)
+    c = np.asarray(coefficients.v())
+    v = np.einsum('np,...p->...n',A,c)
+    var = np.einsum('np,...pq,nq->...n',A,covariance,A)
+    return ufuncs.wrap(v,np.sqrt(np.maximum(var,0)),coefficients.printout())
+
+
+# -----------------------------------------------------------------------
+
+def _jacobian(f,jac,x,p,f0):
+    # (series x points x parameters)
+    k = p.shape[1]
+    params = [p[:,j,None] for j in xrange(k)]
+    if jac is not None:
+        return np.stack([np.broadcast_to(d,f0.shape) for d in jac(x,*params)],axis=-1)
+    J = np.empty(f0.shape+(k,))
+    for j in xrange(k):
+        # forward difference, step relative to the size of the parameter
+        h = np.sqrt(np.finfo(np.float64).eps)*np.maximum(np.abs(p[:,j]),1.0)
+        shifted = list(params)
+        shifted[j] = (p[:,j]+h)[:,None]
+        J[...,j] = (f(x,*shifted)-f0)/h[:,None]
+    return J
+
+def _solve(M,g):
+    # batched M delta = g, least squares for (nearly) singular M
+    try:
+        return np.linalg.solve(M,g[...,None])[...,0]
+    except np.linalg.LinAlgError:
+        return np.einsum('skl,sl->sk',np.linalg.pinv(M),g)
+
+def _normal(J,r):
+    # J^T J and J^T r, per series
+    Jt = J.transpose(0,2,1)
+    return np.matmul(Jt,J), np.matmul(Jt,r[...,None])[...,0]
+
+def _levenberg_marquardt(task):
+    '''
+    fit all series (rows of y) at once,
+    every step only deals with the series that haven't converged yet;
+    one task is a chunk of series with everything it needs, see _curvefit()
+    returns parameters, covariances (unscaled), chi^2 and whether each series converged
+    '''
+    f, jac, x, y, w, p, maxiter, tol = task
+    x = x[None,:]
+    k = p.shape[1]
+    model = lambda p: np.broadcast_to(f(x,*[p[:,j,None] for j in xrange(k)]),(len(p),x.shape[1]))
+    f0 = np.array(model(p))
+    chi2 = np.sum(((y-f0)*w)**2,axis=1)
+    lam = np.full(len(y),1e-3)
+    active = np.ones(len(y),dtype=bool)
+    for _ in xrange(maxiter):
+        idx = np.flatnonzero(active)
+        if len(idx)==0: break
+        pa, fa, wa = p[idx], f0[idx], w[idx]
+        M, g = _normal(_jacobian(f,jac,x,pa,fa)*wa[...,None],(y[idx]-fa)*wa)
+        diag = np.diagonal(M,axis1=1,axis2=2)
+        # Marquardt's scaling, kept away from 0 for parameters without influence
+        scale = np.maximum(diag,1e-12*np.max(diag,axis=1)[:,None]+1e-300)
+        delta = _solve(M+lam[idx,None,None]*scale[:,None,:]*np.eye(k),g)
+        trial = pa+delta
+        with np.errstate(all='ignore'):
+            f1 = model(trial)
+            chi2_1 = np.sum(((y[idx]-f1)*wa)**2,axis=1)
+        better = chi2_1<=chi2[idx] # nan (model undefined at trial) is not better
+        done = better & ((chi2[idx]-chi2_1<=tol*chi2[idx]) |
+                         (np.max(np.abs(delta)/np.maximum(np.abs(pa),tol),axis=1)<=tol))
+        accept = idx[better]
+        p[accept], f0[accept], chi2[accept] = trial[better], f1[better], chi2_1[better]
+        lam[idx] = np.where(better,lam[idx]/10,lam[idx]*10)
+        # no step improves any more: at the minimum within numerical precision
+        active[idx] = ~done & (lam[idx]<1e16)
+    M, _ = _normal(_jacobian(f,jac,x,p,f0)*w[...,None],np.zeros_like(y))
+    try:
+        cov = np.linalg.inv(M)
+    except np.linalg.LinAlgError:
+        cov = np.linalg.pinv(M)
+    return p, cov, chi2, ~active
+
+def _curvefit(f,x,y,s,p0,jac,maxiter,tol,scale_covariance,processes,chunksize):
+    # y, s (series x points), p0 (series x parameters)
+    n, k = y.shape[1], p0.shape[1]
+    if n<k:
+        raise ValueError, 'Cannot fit {0} parameters to {1} points'.format(k,n)
+    w = 1.0/s
+    tasks = [(f,jac,x,y[i:i+chunksize],w[i:i+chunksize],p0[i:i+chunksize],maxiter,tol)
+             for i in xrange(0,len(y),chunksize)]
+    results = pool_map(_levenberg_marquardt,tasks,processes)
+    p, cov, chi2, converged = [np.concatenate(r) for r in zip(*results)]
+    if not np.all(converged):
+        warnings.warn('curvefit did not converge for {0} of {1} series'.format(np.sum(~converged),len(y)))
+    if scale_covariance:
+        cov = cov*(chi2/max(n-k,1))[:,None,None]
+    return p, cov
+
+def curvefit(f,xi,yi,p0,si=None,jac=None,maxiter=200,tol=1e-10,
+             overwrite_zeroerrors=False,scale_covariance=False):
+    '''
+    weighted nonlinear least squares fit (Levenberg-Marquardt) of y = f(x,p0,p1,...)
+    f = the model, see module description
+    xi the x values,
+    yi the y values, errvallist or plain numbers,
+    p0 = initial guess of the parameters
+    si the errors of yi (taken from yi if it is an errvallist)
+    jac = None (forward differences) or jac(x,p0,p1,...) = [df/dp0, df/dp1, ...]
+    maxiter, tol = at most maxiter steps, done when chi^2 (or every parameter)
+        changes by less than tol (relative)
+    overwrite_zeroerrors = see linreg()
+    scale_covariance = True scales the covariance with chi^2/(points-parameters)
+
+    returns the list of parameters as errval's
+    (errors = sqrt of the diagonal of the covariance) and the covariance matrix
+    '''
+    y, s, printout = _data(yi,si)
+    x = np.asarray(xi,dtype=np.float64)
+    if len(x)!=len(y):
+        raise ValueError, 'Inputs cannot be brought together with lengths {}, {}'.format(len(x),len(y))
+    s = _errors(np.broadcast_to(s,np.shape(y)),overwrite_zeroerrors)
+    p, cov = _curvefit(f,x,np.atleast_2d(np.asarray(y,dtype=np.float64)),s,
+                       np.array(p0,dtype=np.float64,ndmin=2),jac,maxiter,tol,scale_covariance,None,1)
+    return [errval(p[0,j],np.sqrt(cov[0,j,j]),printout) for j in xrange(p.shape[1])], cov[0]
+
+def curvefit_batch(f,xi,yi,p0,si=None,jac=None,maxiter=200,tol=1e-10,
+                   overwrite_zeroerrors=False,scale_covariance=False,processes=None,chunksize=1000):
+    '''
+    curvefit() of many independent series sharing the same x grid
+    yi = (series x points) array or errarray
+    p0 = initial guess, one for all series (parameters) or one per series (series x parameters)
+    si = errors, of the same shape as yi or one row shared by all series
+    processes = None fits here, otherwise the chunks of chunksize series are fitted
+        on a pool of that many processes (see parallel.pool_map; f and jac have to be picklable)
+    within a chunk the series are fitted all at once (vectorized)
+
+    returns errarray of the parameters (series x parameters)
+    and the covariances (series x parameters x parameters)
+    '''
+    y, s, printout = _data(yi,si)
+    y = np.asarray(y,dtype=np.float64)
+    if y.ndim!=2:
+        raise ValueError, 'Expected a two-dimensional yi (series x points), got shape {}'.format(y.shape)
+    x = np.asarray(xi,dtype=np.float64)
+    if len(x)!=y.shape[1]:
+        raise ValueError, 'Inputs cannot be brought together with lengths {}, {}'.format(len(x),y.shape[1])
+    s = _errors(np.broadcast_to(s,y.shape),overwrite_zeroerrors)
+    p0 = np.array(np.broadcast_to(np.array(p0,dtype=np.float64,ndmin=2),(len(y),np.shape(p0)[-1])))
+    p, cov = _curvefit(f,x,y,s,p0,jac,maxiter,tol,scale_covariance,processes,chunksize)
+    return errarray(p,np.sqrt(np.diagonal(cov,axis1=1,axis2=2)),printout), cov
@@ -0,0 +1,153 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Format whole lists of errval's at once, straight from the value and error arrays.
+
+The printouts are the ones of errval:
+ 'latex'  v \pm e
+ '+-'     v +- e
+ 'cp'     errval(v,e)
+ 'cpp'    errval(v,e,errvalmode)
+Unrounded, every number is formatted with str, as in print(errval) (12 significant digits).
+With digits = n, errors are rounded to n significant digits
+and values to the same decimal place:
+    format_errvals(errvallist([1.23456,20.5],[0.0123,1.6]),digits=1)
+    ['1.23 \pm 0.01', '20 \pm 2']
+
+write_table() streams rows of one or more columns (LaTeX or CSV)
+to a file handle, chunk by chunk, such that the table is never held in memory as a whole.
+'''
+
+import numpy as np
+
+from errval import *
+from errvallist import *
+from errarray import *
+from errarray import _columns
+
+
+_TEMPLATES = {'latex': '{0} \\pm {0}',
+              '+-': '{0} +- {0}',
+              'cp': 'errval({0},{0})',
+              'cpp': 'errval({0},{0},errvalmode)'}
+
+
+def _template(printout,spec):
+    # anything unknown is latex, as in errval.__str__
+    return _TEMPLATES.get(printout,_TEMPLATES['latex']).format(spec)
+
+def _flat(x):
+    # flat values and errors
+    v, e, _ = _columns(x)
+    if e is None:
+        raise TypeError, 'Cannot format {0}'.format(type(x))
+    return np.asarray(v,dtype=np.float64).ravel(), np.asarray(e,dtype=np.float64).ravel()
+
+def significant(v,e,digits=1):
+    '''
+    round the errors e to digits significant digits, the values v to the same decimal place
+    returns the rounded v and e, the number of decimals of each entry
+    (negative: rounded to tens, hundreds, ...) and which entries were rounded;
+    entries without a finite, positive error stay as they are
+    '''
+    v, e = np.asarray(v,dtype=np.float64), np.asarray(e,dtype=np.float64)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        valid = np.isfinite(e) & (e>0)
+        safe = np.where(valid,e,1.0)
+        decimals = digits-1-np.floor(np.log10(safe)).astype(np.int64)
+        er = np.rint(safe*10.0**decimals)/10.0**decimals
+        # rounding up may add a digit (0.096 -> 0.10), one digit less then
+        decimals = np.minimum(decimals,digits-1-np.floor(np.log10(er)).astype(np.int64))
+        scale = 10.0**decimals
+        vr = np.where(valid,np.rint(v*scale)/scale,v)
+        er = np.where(valid,np.rint(safe*scale)/scale,e)
+    return vr, er, np.where(valid,decimals,0), valid
+
+def _rows(v,e,printout,digits):
+    # the formatted entries, as a list of strings
+    # tolist() gives python floats, whose str is the one of errval.__str__
+    if digits is None:
+        template = _template(printout,'%s')
+        return [template % row for row in zip(v.tolist(),e.tolist())]
+    vr, er, decimals, valid = significant(v,e,digits)
+    rounded = _template(printout,'%.*f')
+    exact = _template(printout,'%s')
+    return [rounded % (n,a,n,b) if ok else exact % (a,b)
+            for a, b, n, ok in zip(vr.tolist(),er.tolist(),np.maximum(decimals,0).tolist(),valid.tolist())]
+
+def format_errvals(evl,printout=None,digits=None):
+    '''
+    list of strings, one per entry of the errvallist (or errval, or errarray, flattened) evl
+    printout = None takes the printout of evl
+    digits = None: unrounded, otherwise significant digits of the errors
+    '''
+    if printout is None: printout = evl.printout()
+    v, e = _flat(evl)
+    return _rows(v,e,printout,digits)
+
+def round_significant(evl,digits=1):
+    '''
+    new errval/errvallist/errarray: errors rounded to digits significant digits,
+    values to the same decimal place
+    '''
+    v, e = _flat(evl)
+    vr, er, _, _ = significant(v,e,digits)
+    if isinstance(evl,errval):
+        return errval._new(vr[0],er[0],evl.printout())
+    if isinstance(evl,errarray):
+        return errarray._from_arrays(vr.reshape(evl.shape),er.reshape(evl.shape),evl.printout())
+    return errvallist._from_arrays(vr,er,evl.printout())
+
+
+_STYLES = {
+    # cell of an errvallist column, cell separator, line end
+    'latex': ('$%s$', ' & ', ' \\\\\n'),
+    'csv': (None, ',', '\n'),
+    }
+
+def _cells(column,style,digits):
+    # formatted cells of one column, as a list of strings per output column
+    if isinstance(column,(errval,errvallist)):
+        v, e = _flat(column)
+        if style=='csv':
+            if digits is None:
+                return [['%r' % x for x in v.tolist()], ['%r' % x for x in e.tolist()]]
+            vr, er, decimals, valid = significant(v,e,digits)
+            decimals = np.maximum(decimals,0).tolist()
+            return [[('%.*f' % (n,x) if ok else '%r' % x) for x, n, ok in zip(values,decimals,valid.tolist())]
+                    for values in (vr.tolist(),er.tolist())]
+        cell = _STYLES[style][0]
+        return [[cell % row for row in _rows(v,e,'latex',digits)]]
+    return [['%r' % x for x in np.asarray(column).tolist()]]
+
+def write_table(fh,columns,style='latex',digits=None,header=None,chunksize=65536):
+    '''
+    write a table to a file, one row per entry
+    fh = file handle or path
+    columns = list of errvallist's (or plain arrays of numbers), all of the same length
+    style = 'latex': v \pm e cells, separated by &, rows ending with \\
+            'csv': two comma separated columns (value, error) per errvallist
+    digits = None: unrounded, otherwise significant digits of the errors
+    header = list of column names, written as first line
+        (in csv, an errvallist column 'x' becomes 'x,x_err')
+    chunksize = rows formatted at a time
+    '''
+    if style not in _STYLES:
+        raise ValueError, 'Cannot write table style {0}, choose one of {1}'.format(style,sorted(_STYLES))
+    if isinstance(fh,basestring):
+        with open(fh,'w') as f:
+            return write_table(f,columns,style,digits,header,chunksize)
+    lengths = set([len(c) for c in columns])
+    if len(lengths)>1:
+        raise ValueError, 'Cannot write columns of lengths {0}'.format(sorted(lengths))
+    _, sep, end = _STYLES[style]
+    if header is not None:
+        if style=='csv':
+            header = sum([[h,h+'_err'] if isinstance(c,errvallist) else [h]
+                          for h, c in zip(header,columns)],[])
+        fh.write(sep.join(header)+end)
+    n = lengths.pop() if lengths else 0
+    for start in xrange(0,n,chunksize):
+        cells = sum([_cells(c[start:start+chunksize],style,digits) for c in columns],[])
+        fh.write(''.join([sep.join(row)+end for row in zip(*cells)]))
@@ -2,13 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import warnings
-import re
 import numpy as np
-from itertools import izip, count # izip for maximum efficiency: http://stackoverflow.com/questions/176918/finding-the-index-of-an-item-given-a-list-containing-it-in-python
 
 from errval import *
 from errvallist import *
 from stderrval import *
+from fileio import parse_errvals
 
 '''
 functions for dealing with lists containing errvals
@@ -29,58 +28,29 @@ def tuples(errvall):
     return zip(values(errvall),errors(errvall))
 
 def str2errvallist(strng):
-    p = re.compile('errval\((-?\d*.\d*e?-?\d*?),(\d*.\d*e?-?\d*?),?(errvalmode)?\)') # note, errvalmode is detected, but will throw an error!
-    lst = re.findall(p,strng) # returns list of tuples of length 2 or 3, errval knows how to handle tuple input
-    return errvallist(lst)
+    # note, errvalmode is detected, but will throw an error!
+    # (fileio.read_errvals() reads whole files, errvalmode included)
+    return parse_errvals(strng,allow_errvalmode=False,printout='latex')
     
 
-def _find_index_iteratively(array,value,low=None,high=None):
-    '''
-    same as find_index() but the value has to be exact
-    [low,high] constrains search if approx position in the array is known already
-
-    example:
-    a = [1,2,3,4,5,6,7,8,9,0]
-    it = find_index_iter(a,4)
-    print it, (it==3)
-    it = find_index_iter(a,8,high=6)
-    print it, (it==None)
-    it = find_index_iter(a,8,high=7)
-    print it, (it==7)
-    it = find_index_iter(a,0,low=7)
-    print it, (it==9)
-    '''
-    if low==None: low=0
-    if high==None: high=len(array)-1
-
-    it = low
-    for search in xrange(high-low+1):
-    # one more iteration than range: to get last iteration as well.
-    # if the value is found, this loop should break
-    # if it doesn't the last +=1 is executed, which we can detect.
-        if array[it]==value: break
-        it += 1
-    if it==high+1: it=None # not found; loop didn't break
-    return it
-
-def _find_closest_fooval(L,foo,index=False):
-    # return value from list L,
-    # whose value is closest to the result of function foo 
+def _find_extremum(evl,argfoo,index=False):
+    # return the entry of evl where argfoo points to,
     # index = True or False, whether to return the corresponding index
-    if isinstance(L,errvallist):
-        v = values(L)
+    if isinstance(evl,(list,tuple)) and len(evl)>0 and isinstance(evl[0],errval):
+        evl = errvallist(evl)
+    if isinstance(evl,errvallist):
+        i = argfoo(evl.v())
     else:
-        v = L
-    i = _find_index_iteratively(v,foo(v))
-    if index: return L[i], i
-    else: return L[i]
+        i = argfoo(evl)
+    if index: return evl[i], i
+    else: return evl[i]
 
 def max(evl,index=True):
     # index = True or False, whether to return the corresponding index
-    return _find_closest_fooval(evl,np.max,index)
+    return _find_extremum(evl,np.argmax,index)
 def min(evl,index=True):
     # index = True or False, whether to return the corresponding index
-    return _find_closest_fooval(evl,np.min,index)
+    return _find_extremum(evl,np.argmin,index)
 
 def wmean(evlist):
     '''
@@ -88,16 +58,58 @@ def wmean(evlist):
 
     sigma_<x>^2 = sum(1/sigma_i^2)
     <x> = sum(x_i/sigma_i^2)/sigma_<x>^2
+
+    see errvallist.wmean()
+    '''
+    if not isinstance(evlist,errvallist):
+        evlist = errvallist(evlist)
+    return evlist.wmean()
+
+def groupwmean(evlist,keys,overwrite_zeroerrors=False,means=False):
+    '''
+    weighted mean (see wmean()) of every group of entries with the same key,
+    e.g. repeated measurements keyed by sample ID, all groups in one pass
+    keys = array of integers or labels, one per entry
+    overwrite_zeroerrors = True or False, as in linreg(), applied per group:
+        True: 0 errors are replaced with 0.1*min of the nonzero errors of their group
+        False: raise a ValueError if there is any 0 error
+    means = True additionally returns the plain means (with propagated errors)
+        and the number of entries per group
+
+    returns the (sorted) unique keys and an errvallist of the weighted means,
+    (with means=True: unique keys, weighted means, plain means, counts)
     '''
-    printmode = evlist[0].printout()
-    vals = values(evlist)
-    #print vals
-    errs = errors(evlist)
-    #print errs
-    N = len(evlist)
-    sig_x = np.sum([1.0/si**2 for si in errs])
-    sum_x = np.sum([vals[i]*1.0/errs[i]**2 for i in range(N)])
-    return errval(sum_x*1.0/sig_x,1.0/np.sqrt(sig_x),printmode)
+    if not isinstance(evlist,errvallist):
+        evlist = errvallist(evlist)
+    keys = np.asarray(keys)
+    if keys.shape!=(len(evlist),):
+        raise ValueError, 'Expected one key per entry ({0}), got shape {1}'.format(len(evlist),keys.shape)
+    v, e = evlist.v(), evlist.e()
+    unique, group = np.unique(keys,return_inverse=True)
+    G = len(unique)
+    counts = np.bincount(group,minlength=G)
+
+    zero_errors = e==0
+    si = e
+    if np.any(zero_errors):
+        if not overwrite_zeroerrors:
+            raise ValueError, 'This function cannot operate with 0 error entries.'
+        # smallest nonzero error per group: entries sorted by group, reduced per run
+        order = np.argsort(group,kind='mergesort')
+        starts = np.concatenate(([0],np.cumsum(counts)[:-1]))
+        min_valid = np.minimum.reduceat(np.where(zero_errors,np.inf,e)[order],starts)
+        if np.any(np.isinf(min_valid[group[zero_errors]])):
+            raise ValueError, 'Cannot overwrite 0 errors in a group without any nonzero error.'
+        si = np.where(zero_errors,0.1*min_valid[group],e)
+
+    w = 1.0/si**2
+    sig_x = np.bincount(group,w,G)
+    wm = errvallist._from_arrays(np.bincount(group,v*w,G)/sig_x,1.0/np.sqrt(sig_x),evlist.printout())
+    if not means:
+        return unique, wm
+    m = errvallist._from_arrays(np.bincount(group,v,G)/counts,np.sqrt(np.bincount(group,e**2,G))/counts,
+                                evlist.printout())
+    return unique, wm, m, counts
     
 def interp(v,evxy0,evxy1):
     '''
@@ -144,76 +156,90 @@ def interp(v,evxy0,evxy1):
 def interplist(v,evx,evy, warning_on_extrapolation_attempt=True):
     '''
     v a value corresponding to evx for which we look its counterpart among evy
+    v may also be an array (or list) of such values, all of them are interpolated in one go
     evx must be an ordered (errval,)list or a numpy.ndarray
     evy must be a errvallist
-    when v is outside the coverage of evx we raise an IndexError if error_on_extrapolation_attempt
-    otherwise the edge value is assumed
+    when v is outside the coverage of evx we issue a warning if warning_on_extrapolation_attempt
+    (once per call, no matter how many values are outside)
+    in any case the edge value is assumed
     (careful, your data may then suggest a trend simply because one of the inputs got capped along the way!)
+
+    returns an errval for a single v, an errvallist for an array of v's
     '''
     if not isinstance(evx,(list,tuple,errvallist,np.ndarray)):
         raise TypeError, 'evx is of unexpected type: {0}'.format(type(evx))
     if not isinstance(evy,errvallist):
         raise TypeError, 'This function is for errvallists, try np.interp'
+    if isinstance(evx,(list,tuple)) and any([isinstance(x,errval) for x in evx]):
+        evx = errvallist(evx)
     if isinstance(evx,errvallist):
         evx = evx.v() # errval has only one-dimensional error
-    if isinstance(v,errval): v = v.v()
-    i0 = np.sum([e<=v for e in evx])
+    evx = np.asarray(evx,dtype=np.float64)
+    if isinstance(v,(errval,errvallist)): v = v.v()
+    single = np.ndim(v)==0
+    v = np.atleast_1d(np.asarray(v,dtype=np.float64))
+
+    # same as counting the entries e<=v, but by bisection
+    i0 = np.searchsorted(evx,v,side='right')
     nevx, nevy = map(len,[evx,evy])
     if warning_on_extrapolation_attempt:
-        if i0==0:
-            warnings.warn('Requested value ({}) is *below* interpolation, results won\'t make sense. Set error_on_extrapolation_attempt=False in order to ignore this and clip.'.format(v))
-        elif i0==nevx:
-            warnings.warn('Requested value ({}) is *above* interpolation, results won\'t make sense. Set error_on_extrapolation_attempt=False in order to ignore this and clip.'.format(v))
+        for outside, where in [(i0==0,'below'),(i0==nevx,'above')]:
+            if np.any(outside):
+                requested = v[outside][0] if single else v[outside]
+                warnings.warn('Requested value ({}) is *{}* interpolation, results won\'t make sense. Set warning_on_extrapolation_attempt=False in order to ignore this and clip.'.format(requested,where))
     # if outside interpolation values, take top or bottom value.
+    lo = np.maximum(i0-1,0)
+    hix, hiy = np.minimum(i0,nevx-1), np.minimum(i0,nevy-1)
     try:
-        xy0 = (evx[np.max([i0-1,0])],evy[np.max([i0-1,0])])
-        xy1 = (evx[np.min([i0,nevx-1])],evy[np.min([i0,nevy-1])])
+        x0, x1 = evx[lo], evx[hix]
+        y0, y1 = evy.v()[lo], evy.v()[hiy]
+        e0, e1 = evy.e()[lo], evy.e()[hiy]
     except IndexError, e:
-        print '\nIssued with index',i0,'on list lengths',[nevx,nevy],'\n'
-        raise IndexError, e
-    return interp(v,xy0,xy1)
+        raise IndexError, '{0}; issued with indices {1} on list lengths {2}'.format(e,i0,[nevx,nevy])
+
+    # see interp()
+    same = x1==x0 # cannot work with it, take the left point as it is
+    with np.errstate(divide='ignore',invalid='ignore'):
+        scaling = np.where(same,0.0,(v-x0)/(x1-x0))
+    y = y0 + scaling*(y1-y0)
+    ye = e0 + scaling*np.abs(e1-e0)
+    if single:
+        return errval(y[0],ye[0],evy.printout() if same[0] else 'latex')
+    return errvallist(y,ye,evy.printout())
 
 def reorder(evlist, instr):
-    return errvallist([evlist[i] for i in instr])
+    if not isinstance(evlist,errvallist):
+        evlist = errvallist(evlist)
+    return evlist.take(instr)
 
 def sorting_instr(evlist):
-    #http://stackoverflow.com/questions/176918/finding-the-index-of-an-item-given-a-list-containing-it-in-python
-    #http://stackoverflow.com/questions/479897/how-do-you-remove-duplicates-from-a-list-in-python-if-the-item-order-is-not-impo
-    v = sorted(values(evlist))
-    ret = []
-    for k in v:
-        ret.extend([i for i, j in izip(count(), evlist.v()) if j == k])
-    return ret
+    # indices that sort evlist by value, ties keep their order
+    if not isinstance(evlist,errvallist):
+        evlist = errvallist(evlist)
+    return list(evlist.argsort())
 
 # -----------------------------------------------------------------------
 
-def _linregA(B, xys):
+def _linregsums(xi, yi, si, axis=-1):
     '''
     help function for linreg()
-    xys = zip(xi, yi, si) values and uncertainties in tuple-form for easier access
-    B from y=A+Bx
+    weighted sums entering the least squares solution, w = 1/si^2:
+    sum(w), sum(w*x), sum(w*y), sum(w*x*y), sum(w*x^2)
+    reduced along axis
     '''
-    xi, yi, si = zip(*xys)
-    n = len(xys)
-    isi = np.sum([1.0/ssi**2 for ssi in si]) # sum of inverse error squares
-    A = 1.0/isi * np.sum([(yi[i]-B*xi[i])/si[i]**2 for i in xrange(n)])
-    return A
+    w = 1.0/si**2
+    wx = w*xi
+    return [np.sum(t, axis=axis) for t in (w, wx, w*yi, wx*yi, wx*xi)]
 
-def _linregB(xys):
+def _linregAB(S, Sx, Sy, Sxy, Sxx):
     '''
     help function for linreg()
-    xys = zip(xi, yi, si) values and uncertainties in tuple-form for easier access
+    A and B from y=A+Bx given the sums of _linregsums(),
+    works element-wise on arrays of sums as well
     '''
-    xi, yi, si = zip(*xys)
-    n = len(xys)
-    isi = np.sum([1.0/ssi**2 for ssi in si]) # sum of inverse error squares
-    xiyisi2 = np.sum([xi[i]*yi[i]*1.0/si[i]**2 for i in xrange(n)])
-    xisi2 = np.sum([xi[i]*1.0/si[i]**2 for i in xrange(n)])
-    yisi2 = np.sum([yi[i]*1.0/si[i]**2 for i in xrange(n)])
-    xi2si2 = np.sum([xi[i]**2*1.0/si[i]**2 for i in xrange(n)])
-
-    B = (isi*xiyisi2 - xisi2*yisi2)*1.0/(isi*xi2si2 - xisi2**2)
-    return B
+    B = (S*Sxy - Sx*Sy)*1.0/(S*Sxx - Sx**2)
+    A = (Sy - B*Sx)*1.0/S
+    return A, B
 
 def linreg(xi,yi,si,overwrite_zeroerrors=False):
     '''
@@ -246,19 +272,66 @@ def linreg(xi,yi,si,overwrite_zeroerrors=False):
     if len(xi)!=n:
         raise ValueError, 'Inputs cannot be brought together with lengths {}, {}'.format(len(xi),n)
 
-    if 0 in si:
-        valid_errors = np.array(si)!=0
-        if overwrite_zeroerrors and np.sum(valid_errors)>0: # there is at least one valid error
-            min_valid = np.min(si[valid_errors])
-            for i in xrange(n):
-                if si[i]==0: si[i]=min_valid*0.1
+    A, B, sigma_A, sigma_B = _linreg(np.atleast_2d(xi), np.atleast_2d(yi), np.atleast_2d(si),
+                                     np.ones((1,n), dtype=bool), overwrite_zeroerrors)
+    return errval(A[0],sigma_A[0]), errval(B[0],sigma_B[0])
+
+def linreg_batch(xi,yi,si,mask=None,overwrite_zeroerrors=False):
+    '''
+    linreg() for many series at once:
+    one line y=A+Bx per row of the (series x points) arrays.
+    xi, si may also be one-dimensional, e.g. when all series share the same x grid.
+    mask = None or boolean array of the same shape as yi,
+        True marks a missing point (as in numpy.ma) that is left out of the fit
+    overwrite_zeroerrors is applied per series,
+    i.e. a 0 entry is replaced with 0.1*min of the valid errors in its own series
+
+    returns errvallists A and B, with one entry per series
+    '''
+    yi = np.asarray(yi, dtype=np.float64)
+    if yi.ndim!=2:
+        raise ValueError, 'Expected a two-dimensional yi (series x points), got shape {}'.format(yi.shape)
+    try:
+        xi, si = [np.broadcast_to(a, yi.shape) for a in (xi, si)]
+    except ValueError:
+        raise ValueError, 'Inputs cannot be brought together with shapes {}, {}, {}'.format(
+                            np.shape(xi),yi.shape,np.shape(si))
+    if mask is None:
+        valid = np.ones(yi.shape, dtype=bool)
+    else:
+        valid = ~np.broadcast_to(np.asarray(mask, dtype=bool), yi.shape)
+
+    A, B, sigma_A, sigma_B = _linreg(xi, yi, si, valid, overwrite_zeroerrors)
+    return errvallist(A,sigma_A), errvallist(B,sigma_B)
+
+def _linreg(xi,yi,si,valid,overwrite_zeroerrors):
+    '''
+    help function for linreg() and linreg_batch()
+    one fit per row of the two-dimensional inputs,
+    only points marked as valid contribute
+    returns arrays A, B, sigma_A, sigma_B
+    '''
+    xi, yi = [np.where(valid, a, 0.0) for a in (xi, yi)] # keep missing points finite
+    si = np.array(si, dtype=np.float64)
+    zero_errors = (si==0) & valid
+    if np.any(zero_errors):
+        nonzero = valid & ~zero_errors
+        if overwrite_zeroerrors and np.all(np.any(nonzero, axis=1)[np.any(zero_errors, axis=1)]):
+            # every series in question has at least one valid error
+            min_valid = np.min(np.where(nonzero, si, np.inf), axis=1)
+            si = np.where(zero_errors, min_valid[:,None]*0.1, si)
         else:
             raise ValueError, 'This function cannot operate with 0 error entries.'
+    si = np.where(valid, si, np.inf) # zero weight for missing points
+    n = np.sum(valid, axis=1)
 
-    xys = zip(xi,yi,si)
+    # shift x to its mean; this doesn't change B but conditions the sums
+    x0 = np.sum(xi, axis=1)*1.0/np.maximum(n, 1)
+    xi = np.where(valid, xi - x0[:,None], 0.0)
 
-    B = _linregB(xys)
-    A = _linregA(B, xys)
+    sums = _linregsums(xi, yi, si, axis=1)
+    A, B = _linregAB(*sums)
+    A = A - B*x0
 
     # attaching errors with Jackknife:
     #  B. Efron, G. Gong, A Leisurely Look at the Bootstrap, the Jachknife and Cross-Validation,
@@ -266,31 +339,23 @@ def linreg(xi,yi,si,overwrite_zeroerrors=False):
     # for a separate view at this method see also
     # https://github.com/stefantkeller/STK_py_generals/blob/master/jackknife_bootstrap.py
 
+    # the sums without point k follow from the full sums
+    # by subtracting the contribution of point k:
+    # all n replicates at once, instead of n fits
+    terms = _linregsums(xi[...,None], yi[...,None], si[...,None])
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # series without any valid point
+        A_, B_ = _linregAB(*[s_[:,None]-t for s_, t in zip(sums, terms)])
+        A_ = A_ - B_*x0[:,None]
+        A_, B_ = [np.where(valid, X, np.nan) for X in (A_, B_)]
+
+        sigma = lambda X: (n-1)**0.5*np.sqrt(np.nanmean((X-np.nanmean(X, axis=1)[:,None])**2, axis=1))
+        sigma_A = sigma(A_)
+        sigma_B = sigma(B_)
+
     # this makes sense only iff there are enough data available
     # how much 'enough' means is difficult to say
     # but clearly more than two!
-    if len(xi)<=2:
-        sigma_A = np.nan
-        sigma_B = np.nan
-        return errval(A,sigma_A), errval(B,sigma_B)
-        
-        
-    # only evaluate if there are more than two data points available
-
-    A_, B_ = [], []
-    for k in xrange(n):
-        xys_ = [xys[j] for j in xrange(n) if j!=k]
-        b_ = _linregB(xys_)
-        a_ = _linregA(b_, xys_)
-        A_.append(a_)
-        B_.append(b_)
-    Adot,Bdot = map(np.mean,[A_,B_])
-
-    sigma = lambda X,Xdot: (n-1)**0.5*np.std([x-Xdot for x in X], ddof=0)
-    sigma_A = sigma(A_,Adot)
-    sigma_B = sigma(B_,Bdot)
-
-    return errval(A,sigma_A), errval(B,sigma_B)
-    
-    
-
+    sigma_A[n<=2] = np.nan
+    sigma_B[n<=2] = np.nan
+    return A, B, sigma_A, sigma_B
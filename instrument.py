@@ -0,0 +1,172 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Where does the time go?
+Opt-in instrumentation of errorvalues:
+
+with instrumented():
+    ... # your analysis
+report() # summary of what happened inside the with block
+
+or, for a whole script, set the environment variable
+    ERRORVALUES_INSTRUMENT=1
+and the summary is printed when the script exits.
+
+Counted are
+ . errval instantiations by path: copy, tuple, numeric (errval(...)),
+   and internal (results of operators, entries taken out of an errvallist)
+ . operator calls of errval and errvallist, by type of the other operand
+ . calls and time spent in linreg, linreg_batch, interplist, wmean, groupwmean,
+   stderrvallist, stderrvallist_mmap, str2errvallist, read_errvals
+
+While enabled, the instrumented methods and functions are replaced by counting wrappers;
+disable() puts the originals back,
+such that there is no overhead at all as long as instrumentation is off.
+'''
+
+import os
+import sys
+import time
+import atexit
+import functools
+from collections import defaultdict
+
+from errval import errval
+from errvallist import errvallist
+
+
+_PACKAGE = __name__.rpartition('.')[0]
+_OPERATORS = ['__add__','__radd__','__sub__','__rsub__','__mul__','__rmul__',
+              '__div__','__rdiv__','__truediv__','__rtruediv__','__pow__','__rpow__','__abs__']
+_TIMED = ['linreg','linreg_batch','interplist','wmean','groupwmean',
+          'stderrvallist','stderrvallist_mmap','str2errvallist','read_errvals']
+
+instantiations = defaultdict(int) # path: count
+operators = defaultdict(int) # (class, operator, type of other): count
+timings = defaultdict(lambda: [0,0.0]) # function: [calls, seconds]
+
+_originals = [] # (owner, name, original attribute) to restore
+_depth = [0]
+
+
+def _init_path(val):
+    # mirrors the dispatch in errval.__init__
+    if isinstance(val,errval): return 'copy'
+    if isinstance(val,tuple): return 'tuple'
+    if isinstance(val,(int,float,long)): return 'numeric'
+    return 'invalid'
+
+def _patch(owner,name,replacement):
+    _originals.append((owner,name,owner.__dict__[name] if isinstance(owner,type) else getattr(owner,name)))
+    setattr(owner,name,replacement)
+
+def _counting_init(init):
+    @functools.wraps(init)
+    def wrapper(self,val,*args,**kwargs):
+        instantiations[_init_path(val)] += 1
+        return init(self,val,*args,**kwargs)
+    return wrapper
+
+def _counting_new(new):
+    def wrapper(cls,*args):
+        instantiations['internal'] += 1
+        return new(cls,*args)
+    return classmethod(wrapper)
+
+def _counting_operator(cls,name,op):
+    @functools.wraps(op)
+    def wrapper(self,*args):
+        other = type(args[0]).__name__ if args else '-'
+        operators[(cls.__name__,name,other)] += 1
+        return op(self,*args)
+    return wrapper
+
+def _timing(name,func):
+    @functools.wraps(func)
+    def wrapper(*args,**kwargs):
+        t0 = time.time()
+        try:
+            return func(*args,**kwargs)
+        finally:
+            entry = timings[name]
+            entry[0] += 1
+            entry[1] += time.time()-t0
+    return wrapper
+
+def _modules():
+    # the modules of this package (the package itself included)
+    return [m for key, m in sys.modules.items()
+            if m is not None and (key==_PACKAGE or key.startswith(_PACKAGE+'.'))]
+
+def enable():
+    _depth[0] += 1
+    if _depth[0]>1: return # already on
+    _patch(errval,'__init__',_counting_init(errval.__dict__['__init__']))
+    _patch(errval,'_new',_counting_new(errval.__dict__['_new'].__func__))
+    for cls in (errval,errvallist):
+        for name in _OPERATORS:
+            if name in cls.__dict__:
+                _patch(cls,name,_counting_operator(cls,name,cls.__dict__[name]))
+    # the functions are star-imported into several modules, replace them everywhere
+    # (the lazily loaded package has to import them all first,
+    # and they are all looked up before patching any, the package may get them from a patched module)
+    package = sys.modules.get(_PACKAGE)
+    if hasattr(package,'_load_all'):
+        package._load_all()
+    targets = [(module,name,getattr(module,name,None)) for module in _modules() for name in _TIMED]
+    wrappers = {}
+    for module, name, func in targets:
+        if func is None or not callable(func): continue
+        if id(func) not in wrappers:
+            wrappers[id(func)] = _timing(name,func)
+        _patch(module,name,wrappers[id(func)])
+
+def disable():
+    if _depth[0]==0: return
+    _depth[0] -= 1
+    if _depth[0]>0: return # an outer instrumented() is still on
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner,name,original)
+
+def reset():
+    instantiations.clear()
+    operators.clear()
+    timings.clear()
+
+class instrumented(object):
+    '''
+    context manager: instrumentation on inside the with block
+    reset = True starts the counts from zero
+    '''
+    def __init__(self,reset=True):
+        self.reset = reset
+    def __enter__(self):
+        if self.reset: reset()
+        enable()
+        return sys.modules[__name__]
+    def __exit__(self,*exc):
+        disable()
+        return False
+
+def report(out=None):
+    # print the summary of everything counted so far
+    out = out or sys.stderr
+    out.write('errorvalues instrumentation\n')
+    out.write('errval instantiations:\n')
+    for path in sorted(instantiations):
+        out.write('  {0:<30s} {1:>12d}\n'.format(path,instantiations[path]))
+    out.write('operator calls:\n')
+    for key in sorted(operators,key=lambda k: -operators[k]):
+        out.write('  {0:<30s} {1:>12d}\n'.format('{0}.{1}({2})'.format(*key),operators[key]))
+    out.write('function timings:              calls      total [s]       mean [s]\n')
+    for name in sorted(timings,key=lambda k: -timings[k][1]):
+        calls, seconds = timings[name]
+        out.write('  {0:<22s} {1:>12d} {2:>14.6f} {3:>14.6f}\n'.format(name,calls,seconds,seconds/calls))
+
+def _from_environment():
+    # ERRORVALUES_INSTRUMENT=1: instrument the whole run, report at exit
+    if os.environ.get('ERRORVALUES_INSTRUMENT','') not in ('','0'):
+        enable()
+        atexit.register(report)
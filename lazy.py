@@ -0,0 +1,164 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Lazy evaluation of whole formulas:
+
+a, b = lazy(errval(2,0.1)), lazy(errvallist([1,2,3],[0.1,0.2,0.3]))
+c = (a*b - np.exp(b))/a # nothing is computed yet, c is an expression graph
+c.evaluate() # errvallist
+
+The eager operators of errval treat every operand as independent,
+hence errval(2,1)-errval(2,1) (or a-a) comes with an error of sqrt(2),
+and every intermediate step creates a new errval(list).
+Here, evaluate() computes all values in one forward pass,
+and the derivative of the result with respect to every input in one reverse pass
+(reverse mode differentiation).
+Only then the errors of the inputs are combined,
+ dc = sqrt( sum_inputs (dc/dx)**2 * dx**2 ),
+so an input that appears several times is accounted for correctly: a-a is 0+-0.
+
+Repeated inputs are recognized by the node: wrap each input once with lazy()
+and reuse that node (wrapping the same errval twice gives two independent inputs).
+'''
+
+import numpy as np
+
+from errval import *
+from errvallist import *
+from errarray import *
+import ufuncs
+
+
+class lazyval(object):
+    '''
+    node of an expression graph:
+    either an input (op None, with value and error),
+    or the ufunc op applied to args (lazyval's or plain numbers/arrays)
+    '''
+    __array_priority__ = 100
+
+    def __init__(self,op=None,args=(),value=None,error=None,printout='latex',array=False):
+        self.op = op
+        self.args = args
+        self.value = value
+        self.error = error
+        self.printout = printout
+        self.array = array # input from an errarray
+
+    def _apply(self,ufunc,*args):
+        # errval's mixed in become inputs of their own
+        args = tuple([lazy(a) if isinstance(a,(errval,errvallist,errarray)) else a for a in args])
+        return lazyval(ufunc,args)
+
+    def __add__(self,other): return self._apply(np.add,self,other)
+    def __radd__(self,other): return self._apply(np.add,other,self)
+    def __sub__(self,other): return self._apply(np.subtract,self,other)
+    def __rsub__(self,other): return self._apply(np.subtract,other,self)
+    def __mul__(self,other): return self._apply(np.multiply,self,other)
+    def __rmul__(self,other): return self._apply(np.multiply,other,self)
+    def __div__(self,other): return self._apply(np.divide,self,other)
+    def __rdiv__(self,other): return self._apply(np.divide,other,self)
+    def __truediv__(self,other): return self.__div__(other)
+    def __rtruediv__(self,other): return self.__rdiv__(other)
+    def __pow__(self,other): return self._apply(np.power,self,other)
+    def __rpow__(self,other): return self._apply(np.power,other,self)
+    def __neg__(self): return self._apply(np.negative,self)
+    def __pos__(self): return self
+    def __abs__(self): return self._apply(np.absolute,self)
+
+    def sqrt(self): return self._apply(np.sqrt,self)
+    def exp(self): return self._apply(np.exp,self)
+    def log(self): return self._apply(np.log,self)
+    def log10(self): return self._apply(np.log10,self)
+    def log2(self): return self._apply(np.log2,self)
+
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        # np.exp(lazyval) & co. extend the graph as well
+        if method!='__call__' or kwargs or not ufuncs.supported(ufunc):
+            return NotImplemented
+        return self._apply(ufunc,*inputs)
+
+    def _nodes(self):
+        # all nodes of the graph, every node after its args (topological order)
+        order, seen = [], set()
+        stack = [(self,False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if id(node) in seen: continue
+            seen.add(id(node))
+            stack.append((node,True))
+            for arg in node.args:
+                if isinstance(arg,lazyval) and id(arg) not in seen:
+                    stack.append((arg,False))
+        return order
+
+    def evaluate(self):
+        '''
+        value and error of the expression,
+        as errval (scalar result) or errvallist (one-dimensional result),
+        errarray if any input is one (or the result has more dimensions)
+        '''
+        nodes = self._nodes()
+        inputs = [node for node in nodes if node.op is None]
+        array = any([node.array for node in inputs])
+        if self.op is None:
+            # copies: the result must not share the buffers of the input
+            return ufuncs.wrap(np.array(self.value,copy=True),np.array(self.error,copy=True),self.printout,array)
+
+        # forward: values and local derivatives of every node
+        values, local = {}, {}
+        for node in nodes:
+            if node.op is None:
+                values[id(node)] = node.value
+                continue
+            args = [values[id(a)] if isinstance(a,lazyval) else a for a in node.args]
+            values[id(node)], local[id(node)] = ufuncs.derivatives(node.op,*args)
+        result = values[id(self)]
+        shape = np.shape(result)
+
+        # reverse: derivative of the result with respect to every node;
+        # all operations are element-wise, so these keep the shape of the result
+        adjoint = {id(self): np.ones(shape)}
+        for node in reversed(nodes):
+            if node.op is None or id(node) not in adjoint: continue
+            adj = adjoint[id(node)]
+            for arg, d in zip(node.args,local[id(node)]):
+                if not isinstance(arg,lazyval): continue
+                contribution = adj*d
+                if id(arg) in adjoint:
+                    contribution = contribution + adjoint[id(arg)]
+                adjoint[id(arg)] = contribution
+
+        # the inputs the result depends on, with their adjoints as derivatives
+        used = [node for node in inputs if id(node) in adjoint]
+        error = ufuncs.combine(shape,[adjoint[id(node)] for node in used],[node.error for node in used])
+        return ufuncs.wrap(result,error,self._leftmost().printout,array)
+
+    def _leftmost(self):
+        # like with errval's, the result takes the printout of the left operand
+        node = self
+        while node.op is not None:
+            node = ([a for a in node.args if isinstance(a,lazyval)] or [lazy(0)])[0]
+        return node
+
+
+def lazy(x):
+    '''
+    input node of an expression graph, see lazyval
+    x = errval, errvallist, errarray, or a plain number/array (without error)
+    '''
+    if isinstance(x,lazyval):
+        return x
+    if isinstance(x,errval):
+        # float values, such that divide is a true division as in errval
+        return lazyval(value=np.float64(x.val()),error=np.float64(x.err()),printout=x.printout())
+    if isinstance(x,errvallist):
+        return lazyval(value=x.v(),error=x.e(),printout=x.printout())
+    if isinstance(x,errarray):
+        return lazyval(value=x.v(),error=x.e(),printout=x.printout(),array=True)
+    x = np.asarray(x,dtype=np.float64)
+    return lazyval(value=x,error=np.zeros_like(x))
@@ -0,0 +1,99 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Monte Carlo error propagation.
+
+The first order propagation of errval,
+ dc = sqrt( (df/da)**2 * da**2 + (df/db)**2 * db**2 ),
+is only good as long as f is about linear within the errors.
+For strongly nonlinear steps (x**y with uncertain y, log close to 0, ...)
+it can be way off.
+Instead, montecarlo() draws Gaussian samples of every input (value +- error),
+evaluates f on all samples at once and reports the spread of the outcome.
+
+def f(a,b): return a**b
+montecarlo(f,[errval(2,0.5),errvallist([1,2,3],[0.5,0.5,0.5])],n=100000)
+
+f gets arrays of shape (shape of the input)+(samples,),
+i.e. the samples go along the last axis, such that scalar inputs broadcast
+against list inputs just like the values themselves do.
+So f has to be written for numpy arrays and work element-wise.
+'''
+
+import numpy as np
+
+from errval import *
+from errvallist import *
+from errarray import *
+from errarray import _columns
+from stderrval import runningstderrvallist
+from parallel import pool_map
+import ufuncs
+
+
+def _chunk(task):
+    '''
+    evaluate f on one chunk of samples, drawn from the generator of the chunk
+    returns the shape of a single outcome, the accumulator state (count, mean, M2),
+    and the outcomes themselves if they are needed for percentiles
+    '''
+    f, columns, size, seed, keep = task
+    rng = np.random.RandomState(seed)
+    samples = [v[...,None] + e[...,None]*rng.standard_normal(v.shape+(size,)) for v, e in columns]
+    res = np.asarray(f(*samples),dtype=np.float64)
+    res = np.broadcast_to(res,res.shape[:-1]+(size,)) # f may ignore some inputs
+    shape = res.shape[:-1]
+    res = res.reshape(-1,size).T # one row per sample
+    acc = runningstderrvallist().update(res)
+    return shape, acc.count, acc.mean, acc.M2, (res if keep else None)
+
+def montecarlo(f,args,n=10000,chunksize=10000,processes=None,seed=None,percentiles=None):
+    '''
+    f = function of len(args) arrays, see module description
+    args = the inputs: errval's, errvallist's, errarray's or plain numbers (without error)
+    n = number of samples
+    chunksize = samples per evaluation of f; memory is bounded by chunksize x size of the inputs
+    processes = None evaluates the chunks one after another,
+        otherwise on a pool of that many processes (see parallel.pool_map; f has to be picklable)
+    seed = seed of the random numbers; the samples of chunk j come from RandomState([seed,j]),
+        such that the same seed gives the same result with and without a pool
+    percentiles = None: the result is mean +- std of the outcomes
+        (lo, mid, hi), e.g. (15.87,50,84.13): the result is the mid percentile
+        +- half the distance between lo and hi
+        (this requires to keep all outcomes in memory)
+
+    returns an errval, errvallist or errarray (if any input is one),
+    with the printout of the first input with an error
+    '''
+    if n<1:
+        raise ValueError, 'Cannot propagate with {0} samples, n has to be positive'.format(n)
+    if chunksize<1:
+        raise ValueError, 'Cannot evaluate chunks of {0} samples, chunksize has to be positive'.format(chunksize)
+    columns = []
+    for a in args:
+        v, e, _ = _columns(a)
+        v = np.asarray(v,dtype=np.float64)
+        # plain numbers are exact, they are the same in every sample
+        columns.append((v,np.zeros_like(v) if e is None else np.asarray(e,dtype=np.float64)))
+    if seed is None:
+        seed = np.random.randint(2**31)
+    keep = percentiles is not None
+    tasks = [(f,columns,min(chunksize,n-start),[seed,j],keep)
+             for j, start in enumerate(xrange(0,n,chunksize))]
+    # the chunks are reduced as they come in
+    acc, outcomes = runningstderrvallist(), []
+    for shape, count, mean, M2, res in pool_map(_chunk,tasks,processes):
+        if keep: outcomes.append(res)
+        else: acc._combine(count,mean,M2)
+
+    printouts = [a.printout() for a in args if isinstance(a,(errval,errvallist,errarray))]
+    printout = printouts[0] if printouts else 'latex'
+
+    if keep:
+        lo, mid, hi = np.percentile(np.concatenate(outcomes),percentiles,axis=0)
+        v, e = mid, (hi-lo)/2.0
+    else:
+        v, e = acc.mean, acc.std()
+    array = any([isinstance(a,errarray) for a in args])
+    return ufuncs.wrap(v.reshape(shape),e.reshape(shape),printout,array)
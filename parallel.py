@@ -0,0 +1,35 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Process pools for the functions that split their work into independent tasks:
+stderrvallist_mmap (chunks of rows), montecarlo (chunks of samples),
+jackknife and bootstrap (chunks of replicates), curvefit_batch (chunks of series).
+All of them take processes = None (no pool) or the size of the pool.
+'''
+
+from multiprocessing import Pool
+
+
+def pool_map(func,tasks,processes=None,initializer=None,initargs=()):
+    '''
+    func(task) for task in tasks, as an iterator in the order of tasks,
+    such that the caller can reduce the results one by one as they come in
+    processes = None runs the tasks here, one after another, each when its result is asked for,
+        otherwise on a pool of this many processes (0: as many as there are CPUs);
+        func has to be defined at module level and the tasks have to be picklable then
+    initializer(*initargs) runs once in every worker process of the pool,
+        e.g. to hand over large data once instead of with every task
+    '''
+    if processes is None:
+        return (func(task) for task in tasks)
+    return _pooled(func,tasks,Pool(processes or None,initializer=initializer,initargs=initargs))
+
+def _pooled(func,tasks,pool):
+    try:
+        for result in pool.imap(func,tasks):
+            yield result
+    finally:
+        # also if the caller stops early: the remaining tasks are dropped
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,130 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Errors of arbitrary estimators by resampling the data:
+jackknife (leave one out) and bootstrap (draw with replacement).
+See
+    B. Efron, G. Gong, A Leisurely Look at the Bootstrap, the Jachknife and Cross-Validation,
+    The American Statistician, Vol 37, No 1 (Feb 1983), pp. 36-48.
+
+data = one array, or a list of arrays, of which the first axis runs over the n samples
+(with several arrays, e.g. x and y, the same samples are taken out of all of them)
+estimator(*data) = a number or a one-dimensional array
+
+jackknife(np.median,measurements)
+bootstrap(lambda x,y: np.corrcoef(x,y)[0,1],[x,y],n=10000,seed=1)
+
+An estimator that can handle many replicates at once should say so with vectorized=True;
+it then gets arrays with an additional first axis that runs over the replicates
+and has to return one result per replicate:
+    bootstrap(lambda x: np.median(x,axis=1),measurements,vectorized=True)
+All other estimators are called once per replicate,
+optionally distributed over a process pool (the estimator has to be picklable then).
+'''
+
+import numpy as np
+
+from errval import *
+from errvallist import *
+import ufuncs
+from parallel import pool_map
+
+
+def _as_data(data):
+    if isinstance(data,(list,tuple)):
+        data = [np.asarray(d) for d in data]
+    else:
+        data = [np.asarray(data)]
+    if len(data)==0:
+        raise ValueError, 'Cannot resample without data'
+    n = len(data[0])
+    if any([len(d)!=n for d in data]):
+        raise ValueError, 'Cannot resample data of lengths {0}'.format([len(d) for d in data])
+    return data, n
+
+def _evaluate(estimator,data,indices):
+    # one result per row of indices, calling the estimator once per replicate
+    return np.array([np.asarray(estimator(*[d[idx] for d in data]),dtype=np.float64)
+                     for idx in indices])
+
+_worker = {}
+def _init_worker(estimator,data):
+    # the data are sent to every worker process once, the tasks are indices only
+    _worker['estimator'], _worker['data'] = estimator, data
+def _evaluate_worker(indices):
+    return _evaluate(_worker['estimator'],_worker['data'],indices)
+
+def _replicates(estimator,data,index_chunks,vectorized,processes):
+    '''
+    estimator on every replicate, index_chunks yields arrays of (replicates x samples) indices
+    returns an array with one row per replicate
+    '''
+    if vectorized:
+        results = [np.asarray(estimator(*[d[idx] for d in data]),dtype=np.float64)
+                   for idx in index_chunks]
+    elif processes is None:
+        results = [_evaluate(estimator,data,idx) for idx in index_chunks]
+    else:
+        results = list(pool_map(_evaluate_worker,list(index_chunks),processes,_init_worker,(estimator,data)))
+    return np.concatenate(results)
+
+def _estimate(estimator,data,vectorized):
+    # estimator on the full data set
+    if vectorized:
+        return np.asarray(estimator(*[d[None] for d in data]),dtype=np.float64)[0]
+    return np.asarray(estimator(*data),dtype=np.float64)
+
+def jackknife(estimator,data,vectorized=False,processes=None,chunksize=1000,printout='latex'):
+    '''
+    estimator +- jackknife standard error
+    sigma = sqrt( (n-1)/n sum_k (theta_k - theta_.)^2 )
+    with theta_k the estimate without sample k, theta_. their mean
+
+    processes = None runs the replicates here, otherwise chunks of replicates
+        go to a pool of that many processes (see parallel.pool_map; ignored if vectorized)
+    chunksize = replicates per batch (vectorized) or per task (process pool)
+    returns errval (scalar estimator) or errvallist (one-dimensional estimator)
+    '''
+    data, n = _as_data(data)
+    if n<2:
+        raise ValueError, 'jackknife needs at least 2 samples, got {0}'.format(n)
+    if chunksize<1:
+        raise ValueError, 'Cannot take chunks of {0} replicates, chunksize has to be positive'.format(chunksize)
+    def index_chunks():
+        keep = np.arange(n-1)
+        for start in xrange(0,n,chunksize):
+            left_out = np.arange(start,min(start+chunksize,n))
+            # row k: all indices but k
+            yield keep[None,:] + (keep[None,:]>=left_out[:,None])
+    theta_ = _replicates(estimator,data,index_chunks(),vectorized,processes)
+    sigma = (n-1)**0.5*np.std(theta_,axis=0,ddof=0)
+    return ufuncs.wrap(_estimate(estimator,data,vectorized),sigma,printout)
+
+def bootstrap(estimator,data,n=1000,seed=None,vectorized=False,processes=None,chunksize=1000,printout='latex'):
+    '''
+    estimator +- bootstrap standard error,
+    the (unbiased) standard deviation of the estimator over n replicates,
+    each drawn with replacement from the data
+
+    seed = seed of the random numbers; the indices of every chunk of replicates are drawn
+        by a generator of their own, RandomState([seed,chunk]), reproducible for any processes
+    processes, chunksize see jackknife()
+    returns errval (scalar estimator) or errvallist (one-dimensional estimator)
+    '''
+    data, m = _as_data(data)
+    if m<1:
+        raise ValueError, 'bootstrap needs at least 1 sample, got {0}'.format(m)
+    if n<2:
+        raise ValueError, 'bootstrap needs at least 2 replicates for a standard deviation, got n={0}'.format(n)
+    if chunksize<1:
+        raise ValueError, 'Cannot take chunks of {0} replicates, chunksize has to be positive'.format(chunksize)
+    if seed is None:
+        seed = np.random.randint(2**31)
+    def index_chunks():
+        for j, start in enumerate(xrange(0,n,chunksize)):
+            rng = np.random.RandomState([seed,j])
+            yield rng.randint(0,m,(min(chunksize,n-start),m))
+    theta_ = _replicates(estimator,data,index_chunks(),vectorized,processes)
+    sigma = np.std(theta_,axis=0,ddof=1)
+    return ufuncs.wrap(_estimate(estimator,data,vectorized),sigma,printout)
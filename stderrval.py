@@ -5,6 +5,8 @@ import numpy as np
 
 from errval import *
 from errvallist import *
+from errarray import *
+from parallel import pool_map
 
 '''
 Convenience functions in order to get standard errors.
@@ -96,5 +98,158 @@ def stderrvallist(li):
     return errvallist(np.mean(li,axis=0),\
                        1.0/np.sqrt(len(li))*np.std(li,axis=0,ddof=1))
 
+def stderrarray(li,axis=0,printout='latex'):
+    # errarray with standard errors along axis of a n-dim array,
+    # keeping the shape of the other axes:
+    # e.g. stack of frames (frames x rows x cols) -> rows x cols
+    li = np.asarray(li,dtype=np.float64)
+    return errarray(np.mean(li,axis=axis),
+                    1.0/np.sqrt(li.shape[axis])*np.std(li,axis=axis,ddof=1),printout)
 
 
+
+#---------------------------------------------------------------------------------------
+
+
+
+class runningstderrval(object):
+    '''
+    standard error of a stream of samples,
+    without keeping the samples in memory
+    (Welford's online algorithm, in its batched form by Chan et al.)
+
+    acc = runningstderrval()
+    acc.update([1,2,3])
+    acc.update(4)
+    acc.result() # same as stderrval([1,2,3,4])
+
+    partial accumulators (e.g. from parallel workers) combine with merge()
+    '''
+    def __init__(self,printout='latex'):
+        self.count = 0
+        self.mean = 0.0
+        self.M2 = 0.0 # sum of squared differences to the mean
+        self.__printout = printout
+
+    def printout(self,change=''):
+        # printout of the result, as for errval
+        if change!='':
+            self.__printout = change
+        return self.__printout
+
+    def _samples(self,batch):
+        return np.asarray(batch,dtype=np.float64).reshape(-1)
+
+    def update(self,batch):
+        batch = self._samples(batch)
+        n = len(batch)
+        if n==0: return self
+        mean = np.mean(batch,axis=0)
+        M2 = np.sum((batch-mean)**2,axis=0)
+        return self._combine(n,mean,M2)
+
+    def merge(self,other):
+        # only the same kind of accumulator, a runningstderrvallist keeps its state per column
+        if type(other) is not type(self):
+            raise TypeError, 'Cannot merge {0} into {1}'.format(type(other),type(self))
+        return self._combine(other.count,other.mean,other.M2)
+
+    def _combine(self,n,mean,M2):
+        if n==0: return self
+        total = self.count+n
+        delta = mean-self.mean
+        self.mean = self.mean + delta*n*1.0/total
+        self.M2 = self.M2 + M2 + delta**2*self.count*n*1.0/total
+        self.count = total
+        return self
+
+    def std(self):
+        # unbiased estimate of the standard deviation
+        if self.count<2: return np.nan*np.ones_like(self.mean)
+        return np.sqrt(self.M2*1.0/(self.count-1))
+
+    def result(self):
+        return errval(float(self.mean),float(1.0/np.sqrt(self.count)*self.std()),self.printout())
+
+
+class runningstderrvallist(runningstderrval):
+    '''
+    column-wise runningstderrval:
+    every update() brings one or more rows of a (samples x columns) matrix,
+    result() is the same as stderrvallist() of all the rows stacked
+    '''
+    def __init__(self,printout='latex'):
+        runningstderrval.__init__(self,printout)
+        self.mean = np.zeros(0)
+        self.M2 = np.zeros(0)
+
+    def _samples(self,batch):
+        batch = np.asarray(batch,dtype=np.float64)
+        if batch.ndim==1: batch = batch[None,:] # a single row
+        batch = batch.reshape(len(batch),-1)
+        if self.count>0 and batch.shape[1]!=len(self.mean):
+            raise ValueError, 'Expected rows with {0} columns, got {1}'.format(len(self.mean),batch.shape[1])
+        return batch
+
+    def _combine(self,n,mean,M2):
+        if self.count==0 and n>0:
+            self.mean, self.M2 = np.zeros_like(mean), np.zeros_like(M2)
+        elif n>0 and len(mean)!=len(self.mean):
+            raise ValueError, 'Cannot combine {0} with {1} columns'.format(len(mean),len(self.mean))
+        return runningstderrval._combine(self,n,mean,M2)
+
+    def result(self):
+        return errvallist(self.mean,1.0/np.sqrt(self.count)*self.std(),self.printout())
+
+
+#---------------------------------------------------------------------------------------
+
+
+
+def _open_rows(path,dtype=np.float64,columns=None):
+    # memory-map a .npy (or raw binary) file as (rows x columns), nothing is read yet;
+    # a file that doesn't have the given number of columns is rejected, not reshaped
+    if path.endswith('.npy'):
+        arr = np.load(path,mmap_mode='r')
+        ncols = int(np.prod(arr.shape[1:]))
+        if columns is not None and ncols!=columns:
+            raise ValueError, 'Expected rows with {0} columns, {1} has {2}'.format(columns,path,ncols)
+        return arr.reshape(-1,ncols)
+    if columns is None:
+        raise ValueError, 'Raw file {0} requires the number of columns'.format(path)
+    arr = np.memmap(path,dtype=dtype,mode='r')
+    # a raw file only knows its size
+    if len(arr)%columns!=0:
+        raise ValueError, 'Raw file {0} of {1} values does not consist of rows with {2} columns'.format(path,len(arr),columns)
+    return arr.reshape(-1,columns)
+
+def _chunk_state(task):
+    # partial accumulator state of rows [start,stop) of one file;
+    # the task is only the file name and the row range, every worker maps the file itself
+    path, dtype, columns, start, stop = task
+    acc = runningstderrvallist().update(_open_rows(path,dtype,columns)[start:stop])
+    return acc.count, acc.mean, acc.M2
+
+def stderrvallist_mmap(paths,chunksize=65536,dtype=np.float64,columns=None,processes=None,printout='latex'):
+    '''
+    stderrvallist() for data that don't fit into memory:
+    paths = one file, or a list of files, each containing rows of the same number of columns
+        .npy files are memory-mapped as they are,
+        any other file is read as raw binary of the given dtype with the given number of columns
+    the rows are processed chunksize at a time,
+    so memory is bounded by chunksize x columns, not by the size of the files
+
+    processes = None processes the chunks one after another,
+        otherwise the chunks are spread over a pool of that many processes (see parallel.pool_map)
+    '''
+    if isinstance(paths,basestring): paths = [paths]
+    tasks = []
+    for path in paths:
+        nrows, ncols = _open_rows(path,dtype,columns).shape
+        if columns is None: columns = ncols
+        tasks.extend([(path,dtype,columns,start,start+chunksize) for start in xrange(0,nrows,chunksize)])
+
+    acc = runningstderrvallist(printout)
+    for state in pool_map(_chunk_state,tasks,processes):
+        acc._combine(*state)
+    return acc.result()
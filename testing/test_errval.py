@@ -54,3 +54,95 @@ def test_arithmetic():
     assert r'{}'.format(ve1/2) == r'1.0 +- 2.0'
     
     assert r'{}'.format(ve0**2) == r'1 \pm 6'
+
+def test_compact():
+    import pickle
+    ve = ev.errval(1,3,'cp')
+    assert not hasattr(ve,'__dict__')
+    for protocol in (0,2):
+        cp = pickle.loads(pickle.dumps(ve,protocol))
+        assert r'{}'.format(cp) == r'{}'.format(ve)
+    res = ve*ev.errval(2,4)
+    assert isinstance(res,ev.errval)
+    assert res.printout() == 'cp'
+
+def test_without_numpy():
+    # the scalar core is imported and used without numpy
+    import sys, subprocess
+    script = ('import sys; import errorvalues as ev; a = ev.errval(2.,0.1); '
+              'r = [a*a, a**a, a.log(), a.log10(), a.log2(), a.round(1)]; '
+              'sys.exit("numpy" in sys.modules)')
+    assert subprocess.call([sys.executable,'-c',script]) == 0
+    # same results as numpy, edge cases included
+    from errorvalues.errval import _log, _log2, _around
+    for x in [0.,-1.,0.35,8.,1e300]:
+        with np.errstate(all='ignore'):
+            assert np.allclose(_log(x),np.log(x),equal_nan=True)
+            assert np.allclose(_log2(x),np.log2(x),equal_nan=True)
+    assert _log2(8.) == 3.0
+    for x in [0.5,1.5,2.5,-2.5,0.125,1234.5678,float('inf')]:
+        for n in [-2,0,2]:
+            assert _around(x,n) == np.around(x,n)
+    assert _around(1234,-2) == 1200 and _around(5,2) == 5
+
+def test_numpy_ufuncs():
+    ve = ev.errval(0.5,0.1,'+-')
+    assert r'{}'.format(np.sqrt(ve)) == r'{}'.format(ve.sqrt())
+    assert r'{}'.format(np.log10(ve)) == r'{}'.format(ve.log10())
+    res = np.exp(ve)
+    assert isinstance(res,ev.errval)
+    assert res.printout() == '+-'
+    assert np.isclose(res.v(),np.exp(0.5))
+    assert np.isclose(res.e(),np.exp(0.5)*0.1)
+    assert np.isclose(np.arctan(ve).e(),0.1/(1+0.5**2))
+    assert np.isclose(np.hypot(ve,ev.errval(1.2,0)).e(),0.1*0.5/1.3)
+    with pytest.raises(TypeError):
+        np.floor(ve) # no sensible derivative
+
+def test_lazy():
+    a, b = ev.errval(2,0.1,'+-'), ev.errval(3,0.2)
+    la, lb = ev.lazy(a), ev.lazy(b)
+    res = (la - la).evaluate()
+    assert res.v() == 0 and res.e() == 0
+    res = (la*la).evaluate()
+    assert np.isclose(res.e(),(a**2).e()) # not the sqrt(2) of independent inputs
+    expr = np.exp(la)*lb/(1+la**2) - np.sin(lb)
+    eager = np.exp(a)*b/(1+a**2) - np.sin(b)
+    res = expr.evaluate()
+    assert isinstance(res,ev.errval) and res.printout() == '+-'
+    assert np.isclose(res.v(),eager.v())
+    # eager propagation treats a (used twice) as independent, the lazy result must not
+    dfda = 3*np.exp(2)*(1-2)**2/(1+2**2)**2
+    dfdb = np.exp(2)/(1+2**2) - np.cos(3)
+    assert np.isclose(res.e(),np.sqrt((dfda*0.1)**2+(dfdb*0.2)**2))
+    mixed = (la*b).evaluate() # errval's mixed in are inputs of their own
+    assert np.isclose(mixed.e(),(a*b).e())
+    # also on the left, through the reflected operators of lazyval
+    for expr, eager in [(b*la,b*a),(b-la,b-a),(b/la,b/a),(b**la,b**a),(b+la,b+a)]:
+        assert isinstance(expr,ev.lazyval)
+        res = expr.evaluate()
+        assert np.isclose(res.v(),eager.v()) and np.isclose(res.e(),eager.e())
+    with pytest.raises(TypeError):
+        a + 'b'
+
+def test_lazy_list():
+    l = ev.lazy(ev.errvallist([1,2,3],[0.1,0.2,0.3]))
+    s = ev.lazy(ev.errval(2,0.5))
+    res = (l*s - s).evaluate()
+    assert isinstance(res,ev.errvallist)
+    assert np.allclose(res.v(),[0,2,4])
+    # d/ds = l-1, d/dl = s
+    assert np.allclose(res.e(),np.sqrt(((np.array([1,2,3])-1)*0.5)**2+(2*np.array([0.1,0.2,0.3]))**2))
+    # evaluating an input gives a copy, in-place operations on it leave the graph alone
+    evl = ev.errvallist([1,2,3],[0.1,0.2,0.3])
+    leaf = ev.lazy(evl)
+    r = leaf.evaluate()
+    r += 1
+    assert np.allclose(evl.v(),[1,2,3]) and np.allclose(leaf.evaluate().v(),[1,2,3])
+    # errvallist on the left
+    evl = ev.errvallist([1,2,3],[0.1,0.2,0.3])
+    expr = evl*s - evl
+    assert isinstance(expr,ev.lazyval)
+    res = expr.evaluate()
+    eager = evl*ev.errval(2,0.5) - evl # each wrapped on its own: independent, as eager
+    assert np.allclose(res.v(),eager.v()) and np.allclose(res.e(),eager.e())
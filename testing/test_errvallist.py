@@ -87,3 +87,280 @@ def test_stderrvallist():
     for j in xrange(len(b)):
         assert a0[j].v() == b[j].v()
         assert a0[j].e() == b[j].e()
+
+def test_columns():
+    abc = ev.errvallist([1,2,3],[3,4,5])
+    assert abc.v().dtype == np.float64
+    assert abc.e().dtype == np.float64
+    assert abc.v() is abc.values() # no copy
+    with pytest.raises(ValueError):
+        ev.errvallist([1,2,3],[3,-4,5])
+    with pytest.raises(ValueError):
+        ev.errvallist([1,2,3],[3,4])
+    abc[1] = ev.errval(7,8)
+    assert abc[1].v() == 7 and abc[1].e() == 8
+    assert len(abc[1:]) == 2
+    # slices and errvallist(l) are copies, as for list
+    s = abc[0:2]
+    s[0] = ev.errval(9,1)
+    assert abc[0].v() == 1 and abc[0].e() == 3
+    b = ev.errvallist(abc)
+    b[2] = ev.errval(9,1)
+    assert abc[2].v() == 3 and not np.shares_memory(b.v(),abc.v())
+    # copy, deepcopy and pickle keep the entries (and nothing else), repr shows them
+    import copy, pickle
+    abc.printout('cp')
+    for c in (copy.copy(abc),copy.deepcopy(abc),pickle.loads(pickle.dumps(abc)),pickle.loads(pickle.dumps(abc,2))):
+        assert isinstance(c,ev.errvallist) and len(c) == 3 and c.printout() == 'cp'
+        assert np.array_equal(c.v(),abc.v()) and np.array_equal(c.e(),abc.e())
+        assert not np.shares_memory(c.v(),abc.v())
+    assert repr(abc) == "errvallist([1.0, 7.0, 3.0],[3.0, 8.0, 5.0],'cp')"
+    assert repr(eval(repr(abc),{'errvallist':ev.errvallist})) == repr(abc)
+
+def test_list_arithmetic():
+    a, b, c = ev.errval(1,3), ev.errval(2,4), ev.errval(3,5)
+    abc = ev.errvallist([a,b,c])
+    cba = ev.errvallist([c,b,a])
+    d = ev.errval(2,0.5)
+    for res, ref in [(abc+cba,[a+c,b+b,c+a]),
+                     (abc-cba,[a-c,b-b,c-a]),
+                     (abc*cba,[a*c,b*b,c*a]),
+                     (abc/cba,[a/c,b/b,c/a]),
+                     (abc*d,[a*d,b*d,c*d]),
+                     (2*abc,[2*a,2*b,2*c])]:
+        assert isinstance(res,ev.errvallist)
+        for j in xrange(len(ref)):
+            assert np.allclose(res[j].v(),ref[j].v())
+            assert np.allclose(res[j].e(),ref[j].e())
+
+def test_inplace():
+    a, b, c = ev.errval(1,3), ev.errval(2,4), ev.errval(3,5)
+    d = ev.errval(2,0.5)
+    for other in (ev.errvallist([c,b,a]),d,2.5):
+        sc = other if not isinstance(other,ev.errvallist) else [c,b,a]
+        ref = lambda f: [f(x,y) for x, y in zip([a,b,c],sc if isinstance(sc,list) else [sc]*3)]
+        for op, iop in [(lambda x,y: x+y,'__iadd__'),(lambda x,y: x-y,'__isub__'),
+                        (lambda x,y: x*y,'__imul__'),(lambda x,y: x/y,'__idiv__'),
+                        (lambda x,y: y-x,'rsub'),(lambda x,y: y/x,'rdiv'),(lambda x,y: x**y,'__ipow__')]:
+            abc = ev.errvallist([a,b,c])
+            v, e = abc.v(), abc.e()
+            if iop=='rsub': res = abc.__rsub__(other)
+            elif iop=='rdiv': res = abc.__rdiv__(other)
+            else:
+                res = getattr(abc,iop)(other)
+                # written into the buffers of abc
+                assert res is abc and res.v() is v and res.e() is e
+            for j, r in enumerate(ref(op)):
+                assert np.isclose(res[j].v(),r.v()) and np.isclose(res[j].e(),r.e())
+    abc = ev.errvallist([a,b,c])
+    abc /= 2 # the operators
+    abc *= ev.errval(2,0)
+    assert np.allclose(abc.v(),[1,2,3]) and np.allclose(abc.e(),[3,4,5])
+    res = 1.0/abc # used to recurse forever
+    assert np.allclose(res.v(),[1,0.5,1./3]) and np.allclose(res.e(),[3,1,5./9])
+    assert np.allclose((1-abc).v(),[0,-1,-2]) and np.allclose((1-abc).e(),[3,4,5])
+    # only the own buffers are written: copies and slices leave the source alone
+    a = ev.errvallist([1,2,3,4],[0.1,0.2,0.3,0.4])
+    b = ev.errvallist(a)
+    b += 1
+    s = a[1:3]
+    s *= 2
+    assert np.allclose(b.v(),[2,3,4,5]) and np.allclose(s.v(),[4,6])
+    assert np.allclose(a.v(),[1,2,3,4]) and np.allclose(a.e(),[0.1,0.2,0.3,0.4])
+    # out buffers of another list, of the same length
+    x = ev.errvallist([1,2,3],[0.1,0.2,0.3])
+    out = ev.errvallist([0,0,0],[0,0,0],'cp')
+    assert x.mul(x,out=out) is out and out.printout() == 'cp'
+    assert np.allclose(out.v(),[1,4,9]) and np.allclose(out.e(),np.sqrt(2)*np.array([0.1,0.4,0.9]))
+    with pytest.raises(ValueError):
+        x.add(x,out=ev.errvallist([0,0],[0,0]))
+    # math methods, alike the ufuncs
+    for name in ('sqrt','exp','log','log10','log2'):
+        ref = getattr(np,name)(x)
+        for res in (getattr(x,name)(), getattr(ev.errvallist(x.v().copy(),x.e().copy()),name)(out=out)):
+            assert np.allclose(res.v(),ref.v()) and np.allclose(res.e(),ref.e())
+        y = ev.errvallist(x.v().copy(),x.e().copy())
+        assert getattr(y,name)(out=y) is y and np.allclose(y.v(),ref.v()) and np.allclose(y.e(),ref.e())
+    # ufuncs with out
+    assert np.multiply(x,x,out=out) is out and np.allclose(out.v(),[1,4,9])
+
+def test_errarray():
+    rng = np.random.RandomState(3)
+    frames = rng.rand(4,3,5)*10
+    a = ev.errarray(frames,np.sqrt(frames))
+    assert a.shape == (4,3,5) and a.ndim == 3 and len(a) == 4
+    # views share the buffers
+    view = a[1:3,:,::2].T
+    assert view.shape == (3,3,2)
+    view[0,0,0] = ev.errval(-1,0.5)
+    assert a[1,0,0].v() == -1 and a[1,0,0].e() == 0.5
+    assert np.shares_memory(a.reshape(4,15).v(),a.v())
+    evl = ev.errvallist([1,2,3,4,5],[0.1,0.2,0.3,0.4,0.5])
+    assert ev.errarray(evl).v() is evl.v() and ev.errarray(evl).as_errvallist().e() is evl.e()
+    # broadcasting, entry by entry the same as errval's
+    dark = ev.errarray(rng.rand(3,1),0.1)
+    for res, ref in [((a-dark)/evl, lambda i,j,k: (a[i,j,k]-dark[j,0])/evl[k]),
+                     (2*a**2+ev.errval(1,1), lambda i,j,k: 2*a[i,j,k]**2+ev.errval(1,1)),
+                     (1-np.sqrt(abs(a)), lambda i,j,k: 1-abs(a[i,j,k])**0.5)]:
+        assert isinstance(res,ev.errarray) and res.shape == (4,3,5)
+        for i, j, k in [(0,0,0),(3,2,4),(1,2,3)]:
+            assert np.isclose(res[i,j,k].v(),ref(i,j,k).v()) and np.isclose(res[i,j,k].e(),ref(i,j,k).e())
+    # both operand orders, against errval's and errvallist's
+    d = ev.errval(2,0.5)
+    for res, ref in [(d*a,a*d),(d-a,-(a-d)),(d/a,a**-1*d),(evl+a,a+evl),(evl-a,-(a-evl)),(evl*a[0],a[0]*evl)]:
+        assert isinstance(res,ev.errarray)
+        assert np.allclose(res.v(),ref.v()) and np.allclose(res.e(),ref.e())
+    # lazy graphs take errarray's too, and keep them
+    la = ev.lazy(a)
+    res = (la - la + d*la).evaluate()
+    assert isinstance(res,ev.errarray) and res.shape == (4,3,5)
+    assert np.allclose(res.v(),(a*d).v()) and np.allclose(res.e(),(a*d).e())
+    res = (d*ev.lazy(a[0,0])).evaluate()
+    assert isinstance(res,ev.errarray) and res.shape == (5,)
+    # in place, into the shared buffers
+    v, before = a.v(), a.copy()
+    a *= 2
+    assert a.v() is v and np.allclose(a.v(),2*before.v()) and np.allclose(a.e(),2*before.e())
+    # reductions along axes
+    m = a.mean(axis=0)
+    assert m.shape == (3,5)
+    assert np.allclose(m.v(),a.v().mean(axis=0))
+    assert np.allclose(m.e(),np.sqrt((a.e()**2).sum(axis=0))/4)
+    assert isinstance(a.sum(),ev.errval) and np.isclose(a.sum().v(),a.v().sum())
+    assert a.sum(axis=(1,2),keepdims=True).shape == (4,1,1)
+    mx = a.max(axis=2)
+    assert np.allclose(mx.v(),a.v().max(axis=2))
+    assert np.allclose(mx.e(),a.e()[np.arange(4)[:,None],np.arange(3)[None,:],a.v().argmax(axis=2)])
+    w = ev.errarray([[1,3],[2,2]],[[1,1],[1,2]]).wmean(axis=1)
+    assert np.allclose(w.v(),[2,2]) and np.allclose(w.e(),[np.sqrt(0.5),np.sqrt(0.8)])
+    assert str(ev.errarray([[1,2],[3,4]],0.5,'+-')) == '[[1.0 +- 0.5,2.0 +- 0.5],[3.0 +- 0.5,4.0 +- 0.5]]'
+    # standard errors keeping the structure
+    s = ev.stderrarray(frames,axis=0)
+    assert s.shape == (3,5)
+    assert np.allclose(s.e(),frames.std(axis=0,ddof=1)/2)
+
+def test_numpy_ufuncs():
+    abc = ev.errvallist([1,2,3],[0.1,0.2,0.3])
+    res = np.sin(abc)
+    assert isinstance(res,ev.errvallist)
+    assert np.allclose(res.v(),np.sin([1,2,3]))
+    assert np.allclose(res.e(),np.abs(np.cos([1,2,3]))*abc.e())
+    for j in xrange(len(abc)):
+        assert np.isclose(np.power(abc,abc)[j].e(),(abc[j]**abc[j]).e())
+    assert isinstance(np.array([1.0,2.0,3.0])*abc,ev.errvallist)
+    assert np.isclose(np.mean(abc).v(),2)
+    assert np.isclose(np.mean(abc).e(),np.sqrt(0.14)/3)
+
+def test_runningstderrval():
+    rng = np.random.RandomState(2)
+    data = rng.randn(50,3)*2+5
+    acc = ev.runningstderrval()
+    for batch in np.array_split(data[:,0],4):
+        acc.update(batch)
+    ref = ev.stderrval(data[:,0])
+    assert np.isclose(acc.result().v(),ref.v())
+    assert np.isclose(acc.result().e(),ref.e())
+
+    parts = [ev.runningstderrvallist().update(rows) for rows in np.array_split(data,3)]
+    accl = parts[0].merge(parts[1]).merge(parts[2])
+    accl.update(data[0]) # single row
+    refl = ev.stderrvallist(np.vstack([data,data[:1]]))
+    assert np.allclose(accl.result().v(),refl.v())
+    assert np.allclose(accl.result().e(),refl.e())
+    with pytest.raises(ValueError):
+        accl.update([1,2])
+    # printout as with errval, merge only the same kind of accumulator
+    acc.printout('+-')
+    assert acc.printout() == '+-' and acc.result().printout() == '+-'
+    assert ev.runningstderrvallist('cp').update(data).result().printout() == 'cp'
+    for x, y in [(acc,accl),(accl,acc)]:
+        with pytest.raises(TypeError):
+            x.merge(y)
+
+def test_stderrvallist_mmap(tmpdir):
+    rng = np.random.RandomState(3)
+    data = rng.randn(100,4)
+    np.save(str(tmpdir.join('a.npy')),data[:60])
+    data[60:].tofile(str(tmpdir.join('b.raw')))
+    paths = [str(tmpdir.join('a.npy')),str(tmpdir.join('b.raw'))]
+    ref = ev.stderrvallist(data)
+    for processes in (None,2):
+        res = ev.stderrvallist_mmap(paths,chunksize=7,columns=4,processes=processes)
+        assert np.allclose(res.v(),ref.v())
+        assert np.allclose(res.e(),ref.e())
+    # the chunk states are produced one at a time, as the reduction asks for them
+    calls = []
+    states = ev.parallel.pool_map(calls.append,[1,2,3])
+    assert calls == [] and next(states) is None and calls == [1]
+    assert list(ev.parallel.pool_map(abs,[-1,-2],processes=2)) == [1,2]
+    # every file has to have the same columns as the first one
+    np.save(str(tmpdir.join('c.npy')),data[:10,:2])
+    data[:10,:3].tofile(str(tmpdir.join('d.raw')))
+    for other in ('c.npy','d.raw'):
+        with pytest.raises(ValueError):
+            ev.stderrvallist_mmap([paths[0],str(tmpdir.join(other))])
+    with pytest.raises(ValueError):
+        ev.stderrvallist_mmap(paths[1],columns=3)
+
+def test_reductions():
+    a, b, c = ev.errval(1,3), ev.errval(4,4), ev.errval(3,5)
+    abc = ev.errvallist([a,b,c])
+    for res, ref in [(abc.sum(),a+b+c),
+                     (np.sum(abc),a+b+c),
+                     (abc.mean(),(a+b+c)/3.0),
+                     (np.mean(abc),(a+b+c)/3.0),
+                     (abc.wmean(),ev.errval(sum([x.v()/x.e()**2 for x in abc])/sum([1.0/x.e()**2 for x in abc]),
+                                            1/np.sqrt(sum([1.0/x.e()**2 for x in abc]))))]:
+        assert np.isclose(res.v(),ref.v())
+        assert np.isclose(res.e(),ref.e())
+    cs = abc.cumsum()
+    for j, ref in enumerate([a,a+b,a+b+c]):
+        assert np.isclose(cs[j].v(),ref.v())
+        assert np.isclose(cs[j].e(),ref.e())
+    assert abc.argmax() == 1 and abc.argmin() == 0
+    assert abc.max().v() == 4 and abc.min().e() == 3
+    assert ev.max(abc)[1] == 1 and ev.min([c,b,a])[1] == 2
+    with pytest.raises(ValueError):
+        abc.sum(axis=1)
+
+def test_propagate():
+    @ev.propagate
+    def f(a,b,c):
+        return np.exp(-a)*np.sin(b)/b + c
+
+    a = ev.errval(1,0.1,'cp')
+    b = ev.errvallist([1,2,3],[0.1,0.2,0.3])
+    res = f(a,b,2.0)
+    assert f.__name__ == 'f'
+    assert isinstance(res,ev.errvallist) and res.printout() == 'cp'
+    bv, be = b.v(), b.e()
+    assert np.allclose(res.v(),np.exp(-1)*np.sin(bv)/bv+2)
+    dfda = -np.exp(-1)*np.sin(bv)/bv
+    dfdb = np.exp(-1)*(np.cos(bv)*bv-np.sin(bv))/bv**2
+    assert np.allclose(res.e(),np.sqrt((dfda*0.1)**2+(dfdb*be)**2))
+    # same as the lazy graph and the eager operators on independent inputs
+    la, lb = ev.lazy(a), ev.lazy(b)
+    lazy = (np.exp(-la)*np.sin(lb)/lb+2).evaluate()
+    assert np.allclose(res.e(),lazy.e())
+    assert np.isclose(f(a,ev.errval(2,0.2),2.0).e(),res[1].e())
+
+def _mc_f(a,b):
+    # module level, such that the process pool can pickle it
+    return a*b + 1
+
+def test_montecarlo():
+    a = ev.errval(2,0.1,'cp')
+    b = ev.errvallist([1,2,3],[0.1,0.2,0.3])
+    res = ev.montecarlo(_mc_f,[a,b],n=40000,chunksize=15000,seed=5)
+    ref = b*a + 1
+    assert isinstance(res,ev.errvallist) and res.printout() == 'cp'
+    assert np.allclose(res.v(),ref.v(),atol=0.02)
+    assert np.allclose(res.e(),ref.e(),rtol=0.03)
+    # reproducible, independent of the process pool
+    par = ev.montecarlo(_mc_f,[a,b],n=40000,chunksize=15000,seed=5,processes=2)
+    assert np.allclose(par.v(),res.v()) and np.allclose(par.e(),res.e())
+    pct = ev.montecarlo(_mc_f,[a,ev.errval(1,0)],n=40000,seed=5,percentiles=(15.87,50,84.13))
+    assert isinstance(pct,ev.errval)
+    assert np.isclose(pct.v(),3,atol=0.01) and np.isclose(pct.e(),0.1,rtol=0.03)
+    with pytest.raises(ValueError):
+        ev.montecarlo(_mc_f,[a,b],n=0)
@@ -31,3 +31,330 @@ def test_round():
     manround = ev.errvallist([(1.23,0.57),(8.9,2.35)])
     assert '{}'.format(ve0.round(2)) == '{}'.format(manround)
 
+def test_groupwmean():
+    rng = np.random.RandomState(5)
+    keys = rng.randint(0,50,1000)*3 # not every integer is a key
+    evl = ev.errvallist(rng.randn(1000),rng.rand(1000)+0.1)
+    unique, wm, m, counts = ev.groupwmean(evl,keys,means=True)
+    assert np.array_equal(unique,np.unique(keys))
+    for j, k in enumerate(unique):
+        group = evl[keys==k]
+        assert counts[j] == len(group)
+        assert np.isclose(wm[j].v(),ev.wmean(group).v()) and np.isclose(wm[j].e(),ev.wmean(group).e())
+        assert np.isclose(m[j].v(),group.mean().v()) and np.isclose(m[j].e(),group.mean().e())
+    # labels, zero errors
+    evl = ev.errvallist([1,2,3,4,5],[0.1,0,0.2,0.3,0.3])
+    labels = ['b','a','b','a','c']
+    with pytest.raises(ValueError):
+        ev.groupwmean(evl,labels)
+    unique, wm = ev.groupwmean(evl,labels,overwrite_zeroerrors=True)
+    assert list(unique) == ['a','b','c']
+    ref = ev.wmean(ev.errvallist([2,4],[0.03,0.3])) # 0.1*smallest nonzero error in group a
+    assert np.isclose(wm[0].v(),ref.v()) and np.isclose(wm[0].e(),ref.e())
+    assert wm[2].v() == 5 and np.isclose(wm[2].e(),0.3)
+    with pytest.raises(ValueError):
+        ev.groupwmean(ev.errvallist([1,2],[0,0]),[0,0],overwrite_zeroerrors=True)
+
+def test_format():
+    from StringIO import StringIO
+    evl = ev.errvallist([1.23456,20.5,1234.5,0.5,3.,np.nan],[0.0123,1.6,56,0.096,0,0.1])
+    # bulk formatting gives the same as formatting entry by entry
+    for printout in ('latex','+-','cp','cpp'):
+        evl.printout(printout)
+        assert '{}'.format(evl) == '['+','.join(['{}'.format(x) for x in evl])+']'
+    # str of the values, as print(errval), not their repr
+    assert '{}'.format(ev.errvallist([0.1+0.2],[0.1])) == '[{}]'.format(ev.errval(0.1+0.2,0.1)) == r'[0.3 \pm 0.1]'
+    assert ev.format_errvals(evl,'latex',digits=1) == [r'1.23 \pm 0.01',r'20 \pm 2',r'1230 \pm 60',
+                                                       r'0.5 \pm 0.1',r'3.0 \pm 0.0',r'nan \pm 0.1']
+    assert ev.format_errvals(evl,'cp',digits=2)[:4] == ['errval(1.235,0.012)','errval(20.5,1.6)',
+                                                        'errval(1234,56)','errval(0.500,0.096)']
+    res = ev.round_significant(evl,2)
+    assert np.allclose(res.v()[:4],[1.235,20.5,1234,0.5]) and np.allclose(res.e()[:4],[0.012,1.6,56,0.096])
+    assert '{}'.format(ev.round_significant(ev.errval(3.14159,0.0234,'+-'))) == '3.14 +- 0.02'
+
+    fh = StringIO()
+    ev.write_table(fh,[np.arange(3),evl[:3]],digits=1,header=['i','x'],chunksize=2)
+    assert fh.getvalue() == 'i & x \\\\\n0 & $1.23 \\pm 0.01$ \\\\\n1 & $20 \\pm 2$ \\\\\n2 & $1230 \\pm 60$ \\\\\n'
+    fh = StringIO()
+    ev.write_table(fh,[evl[:3]],'csv',header=['x'])
+    assert fh.getvalue() == 'x,x_err\n1.23456,0.0123\n20.5,1.6\n1234.5,56.0\n'
+    with pytest.raises(ValueError):
+        ev.write_table(fh,[evl,evl[:3]])
+
+
+def _linreg_bruteforce(xi,yi,si):
+    # straight forward least squares, with jackknife by refitting n times
+    def fit(x,y,s):
+        w = 1.0/s**2
+        S, Sx, Sy, Sxy, Sxx = [np.sum(t) for t in (w,w*x,w*y,w*x*y,w*x*x)]
+        B = (S*Sxy-Sx*Sy)/(S*Sxx-Sx**2)
+        return (Sy-B*Sx)/S, B
+    n = len(xi)
+    A, B = fit(xi,yi,si)
+    keep = [np.arange(n)!=k for k in xrange(n)]
+    A_, B_ = zip(*[fit(xi[m],yi[m],si[m]) for m in keep])
+    sigma = lambda X: (n-1)**0.5*np.std(X,ddof=0)
+    return A, B, sigma(A_), sigma(B_)
+
+def test_linreg():
+    rng = np.random.RandomState(0)
+    xi = np.linspace(100,110,50)
+    si = rng.uniform(0.5,1.5,50)
+    yi = 3.0 - 2.0*xi + si*rng.randn(50)
+    A, B = ev.linreg(xi,yi,si)
+    rA, rB, rsA, rsB = _linreg_bruteforce(xi,yi,si)
+    assert np.allclose([A.v(),B.v(),A.e(),B.e()],[rA,rB,rsA,rsB],rtol=1e-8)
+
+    A, B = ev.linreg(xi[:2],yi[:2],si[:2])
+    assert np.isnan(A.e()) and np.isnan(B.e())
+
+    si[3] = 0
+    with pytest.raises(ValueError):
+        ev.linreg(xi,yi,si)
+    A, B = ev.linreg(xi,yi,si,overwrite_zeroerrors=True)
+    si[3] = 0.1*np.min(si[si>0])
+    rA, rB, rsA, rsB = _linreg_bruteforce(xi,yi,si)
+    assert np.allclose([A.v(),B.v(),A.e(),B.e()],[rA,rB,rsA,rsB],rtol=1e-8)
+
+def test_linreg_batch():
+    rng = np.random.RandomState(1)
+    xi = np.linspace(0,10,20)
+    si = rng.uniform(0.5,1.5,(4,20))
+    yi = 1.0 + np.arange(4)[:,None]*xi + si*rng.randn(4,20)
+    mask = np.zeros((4,20),dtype=bool)
+    mask[1,[2,7,8]] = True
+    mask[3,:18] = True # only two points left
+    A, B = ev.linreg_batch(xi,yi,si,mask=mask)
+    assert isinstance(A,ev.errvallist) and len(B)==4
+    for j in xrange(4):
+        keep = ~mask[j]
+        a, b = ev.linreg(xi[keep],yi[j,keep],si[j,keep])
+        assert np.allclose([A[j].v(),B[j].v()],[a.v(),b.v()])
+        assert np.allclose([A[j].e(),B[j].e()],[a.e(),b.e()],equal_nan=True)
+
+    si[0,5] = 0
+    with pytest.raises(ValueError):
+        ev.linreg_batch(xi,yi,si)
+    A, B = ev.linreg_batch(xi,yi,si,overwrite_zeroerrors=True)
+    si[0,5] = 0.1*np.min(si[0,si[0]>0])
+    a, b = ev.linreg(xi,yi[0],si[0])
+    assert np.allclose([A[0].v(),A[0].e(),B[0].v(),B[0].e()],[a.v(),a.e(),b.v(),b.e()])
+
+def test_linfit():
+    rng = np.random.RandomState(6)
+    x = np.linspace(-1,2,40)
+    s = rng.rand(40)*0.2+0.05
+    y = 1 - 2*x + 0.5*x**2 + s*rng.randn(40)
+    c, cov = ev.linfit(x,ev.errvallist(y,s),degree=2)
+    # numpy.polyfit: highest power first, covariance scaled with chi^2/(n-p) (the older default)
+    ref, refcov = np.polyfit(x,y,2,w=1/s,cov=True)
+    assert np.allclose(c.v(),ref[::-1])
+    c_, cov_ = ev.linfit(x,y,s,degree=2,scale_covariance=True)
+    assert np.allclose(cov_,refcov[::-1,::-1])
+    assert np.allclose(c.e(),np.sqrt(np.diag(cov)))
+    # absolute errors: cov = (A^T W A)^-1
+    A = np.vander(x,3,increasing=True)
+    assert np.allclose(cov,np.linalg.inv(np.dot(A.T/s**2,A)))
+    # same model as basis functions
+    cb, covb = ev.linfit(x,y,s,basis=[np.ones_like,lambda t: t,np.square])
+    assert np.allclose(cb.v(),c.v()) and np.allclose(covb,cov)
+    # the fitted curve with correlated errors
+    fit = ev.linfit_eval(x[:3],c,cov,degree=2)
+    assert np.allclose(fit.v(),np.dot(A[:3],c.v()))
+    assert np.allclose(fit.e()**2,[np.dot(a,np.dot(cov,a)) for a in A[:3]])
+    # straight line as linreg
+    A_, B_ = ev.linreg(x,y,s)
+    c1, _ = ev.linfit(x,y,s)
+    assert np.allclose(c1.v(),[A_.v(),B_.v()])
+    with pytest.raises(ValueError):
+        ev.linfit(x,y,np.where(x>0,s,0))
+    c0, _ = ev.linfit(x,y,np.where(x>1.9,0,s),overwrite_zeroerrors=True)
+    assert np.all(np.isfinite(c0.v())) and np.all(np.isfinite(c0.e()))
+
+def test_linfit_batch():
+    rng = np.random.RandomState(7)
+    x = np.linspace(0,1,25)
+    Y = rng.randn(30,25) + np.outer(rng.randn(30),x**3)
+    s_shared = rng.rand(25)+0.1
+    S = rng.rand(30,25)+0.1
+    for s in (s_shared,S,ev.errarray(Y,s_shared)):
+        if isinstance(s,ev.errarray):
+            c, cov = ev.linfit_batch(x,s,degree=3)
+            s = s_shared
+        else:
+            c, cov = ev.linfit_batch(x,Y,s,degree=3)
+        assert c.shape == (30,4) and cov.shape == (30,4,4)
+        for j in (0,17,29):
+            cj, covj = ev.linfit(x,Y[j],np.broadcast_to(s,Y.shape)[j],degree=3)
+            assert np.allclose(c[j].v(),cj.v()) and np.allclose(c[j].e(),cj.e())
+            assert np.allclose(cov[j],covj)
+    fit = ev.linfit_eval(x,c,cov,degree=3)
+    assert isinstance(fit,ev.errarray) and fit.shape == (30,25)
+
+def _lorentzian(x,x0,gamma,a):
+    return a/(1+((x-x0)/gamma)**2)
+def _lorentzian_jac(x,x0,gamma,a):
+    u = (x-x0)/gamma
+    d = 1+u**2
+    return [2*a*u/(gamma*d**2), 2*a*u**2/(gamma*d**2), 1/d]
+
+def test_curvefit():
+    rng = np.random.RandomState(8)
+    x = np.linspace(-1,2,50)
+    s = rng.rand(50)*0.2+0.05
+    y = 1 - 2*x + 0.5*x**2 + s*rng.randn(50)
+    # a linear model: the same as the linear fit
+    c, cov = ev.linfit(x,y,s,degree=2)
+    p, pcov = ev.curvefit(lambda x,a,b,c: a+b*x+c*x**2,x,ev.errvallist(y,s),[0,0,0])
+    assert all([isinstance(q,ev.errval) for q in p])
+    assert np.allclose([q.v() for q in p],c.v()) and np.allclose(pcov,cov)
+
+    x = np.linspace(0,2,200)
+    s = 0.05*np.ones(200)
+    y = _lorentzian(x,1.1,0.15,5)+s*rng.randn(200)
+    p, pcov = ev.curvefit(_lorentzian,x,y,[1.0,0.1,4.0],si=s)
+    pj, pjcov = ev.curvefit(_lorentzian,x,y,[1.0,0.1,4.0],si=s,jac=_lorentzian_jac)
+    assert np.allclose([q.v() for q in p],[q.v() for q in pj]) and np.allclose(pcov,pjcov,rtol=1e-5)
+    assert abs(p[0].v()-1.1) < 5*p[0].e() and abs(p[2].v()-5) < 5*p[2].e()
+
+    # many series at once, here and in a process pool
+    x0 = 1+0.2*rng.rand(20)
+    Y = _lorentzian(x,x0[:,None],0.15,5)+0.05*rng.randn(20,200)
+    P, C = ev.curvefit_batch(_lorentzian,x,ev.errarray(Y,s),[1.1,0.1,4.0])
+    assert P.shape == (20,3) and C.shape == (20,3,3)
+    for j in (0,13):
+        pj, cj = ev.curvefit(_lorentzian,x,Y[j],[1.1,0.1,4.0],si=s)
+        assert np.allclose(P[j].v(),[q.v() for q in pj]) and np.allclose(C[j],cj)
+    P2, C2 = ev.curvefit_batch(_lorentzian,x,Y,[1.1,0.1,4.0],si=s,jac=_lorentzian_jac,processes=2,chunksize=7)
+    assert np.allclose(P2.v(),P.v()) and np.allclose(C2,C,rtol=1e-5)
+
+def test_interplist_vectorized():
+    import warnings
+    evx = np.array([1.0,2.0,4.0,8.0])
+    evy = ev.errvallist([3.0,1.0,5.0,2.0],[1.0,3.0,0.5,2.0])
+    v = np.array([0.0,1.0,1.5,3.0,7.9,8.0,9.0])
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        res = ev.interplist(v,evx,evy)
+    assert len(w) == 2 # one for below, one for above
+    assert isinstance(res,ev.errvallist)
+    for j in xrange(len(v)):
+        ref = ev.interplist(v[j],evx,evy,warning_on_extrapolation_attempt=False)
+        assert np.isclose(res[j].v(),ref.v())
+        assert np.isclose(res[j].e(),ref.e())
+    assert np.isclose(res[3].v(),3.0) and np.isclose(res[3].e(),4.25)
+    assert res[0].v() == 3.0 and res[6].v() == 2.0 # clipped
+    # evx as a plain list of errval's, as errvallist and as plain numbers
+    for x in ([ev.errval(x,0.1) for x in evx],ev.errvallist(evx,0.1),list(evx)):
+        res = ev.interplist(v[1:5],x,evy)
+        assert np.allclose(res.v(),[3.0,2.0,3.0,2.075]) and np.allclose(res.e(),[1.0,2.0,4.25,1.9625])
+    assert np.isclose(ev.interplist(1.5,[ev.errval(1,.1),ev.errval(2,.1)],evy).v(),2.0)
+
+def test_sorting():
+    evl = ev.errvallist([3,1,2,1,5],[0.1,0.5,0.2,0.4,0.3])
+    instr = ev.sorting_instr(evl)
+    assert instr == [1,3,2,0,4] # ties keep their order
+    assert list(ev.reorder(evl,instr).v()) == [1,1,2,3,5]
+    assert list(ev.reorder(list(evl),instr).e()) == [0.5,0.4,0.2,0.1,0.3]
+    assert list(evl.argsort(by='error')) == [0,2,4,3,1]
+    assert list(evl.argsort(reverse=True)) == [4,0,2,1,3]
+    evl.sort(by='error')
+    assert list(evl.v()) == [3,2,5,1,1]
+    # key, cmp and reverse as for list.sort, on the errval entries
+    other = ev.errvallist(evl)
+    other.sort(key=lambda x: -x.e())
+    assert list(other.e()) == [0.5,0.4,0.3,0.2,0.1]
+    other.sort(cmp=lambda x, y: cmp(x.v(),y.v()),reverse=True)
+    assert list(other.v()) == [5,3,2,1,1] and list(other.e()) == [0.3,0.1,0.2,0.5,0.4]
+    other.sort()
+    assert list(other.v()) == [1,1,2,3,5]
+    with pytest.raises(ValueError):
+        other.sort(by='error',key=abs)
+    assert list(evl.take([4,0]).e()) == [0.5,0.1]
+
+def test_read_write_errvals():
+    from StringIO import StringIO
+    rng = np.random.RandomState(4)
+    evl = ev.errvallist(rng.randn(200)*1e3,rng.rand(200)*1e-3)
+    for printout in ('cp','cpp'):
+        fh = StringIO()
+        ev.write_errvals(fh,evl,printout)
+        fh.seek(0)
+        res = ev.read_errvals(fh,chunksize=7) # plenty of errvals cut by the chunk boundaries
+        assert res.printout() == printout
+        assert np.array_equal(res.v(),evl.v())
+        assert np.array_equal(res.e(),evl.e())
+    fh = StringIO('a = errval(1.5,2e-3,errvalmode)*x + errval(-3,.5)\nerrval(nan,inf)')
+    res = ev.read_errvals(fh)
+    assert len(res) == 3
+    assert res[1].v() == -3 and res[1].e() == 0.5
+    assert np.isnan(res[2].v())
+
+def test_save_load_errvallist(tmpdir):
+    path = str(tmpdir.join('evl.bin'))
+    evl = ev.errvallist(np.arange(5.0),np.linspace(0.1,0.5,5),'+-')
+    ev.save_errvallist(path,evl)
+    for mmap_mode in ('r',None):
+        res = ev.load_errvallist(path,mmap_mode)
+        assert res.printout() == '+-'
+        assert np.array_equal(res.v(),evl.v())
+        assert np.array_equal(res.e(),evl.e())
+    assert isinstance(ev.load_errvallist(path).v(),np.memmap)
+    ev.save_errvallist(path,ev.errvallist())
+    assert len(ev.load_errvallist(path)) == 0
+
+def _slope(x,y):
+    # module level, such that the process pool can pickle it
+    return np.polyfit(x,y,1)
+
+def test_resampling():
+    rng = np.random.RandomState(6)
+    data = rng.randn(40)
+    # the jackknife error of the mean is the standard error
+    jk = ev.jackknife(np.mean,data,chunksize=7)
+    assert np.isclose(jk.v(),ev.stderrval(data).v())
+    assert np.isclose(jk.e(),ev.stderrval(data).e())
+    jkv = ev.jackknife(lambda d: np.mean(d,axis=1),data,vectorized=True,chunksize=7)
+    assert np.isclose(jkv.e(),jk.e())
+
+    bs = ev.bootstrap(np.median,data,n=500,seed=3,chunksize=128)
+    bsv = ev.bootstrap(lambda d: np.median(d,axis=1),data,n=500,seed=3,chunksize=128,vectorized=True)
+    assert np.isclose(bs.v(),np.median(data)) and np.isclose(bs.e(),bsv.e())
+    for call in (lambda: ev.jackknife(np.mean,data[:1]), lambda: ev.jackknife(np.mean,[]),
+                 lambda: ev.bootstrap(np.mean,np.zeros(0)), lambda: ev.bootstrap(np.mean,data,n=1)):
+        with pytest.raises(ValueError):
+            call()
+
+    x = np.linspace(0,1,30)
+    y = 2*x + 1 + 0.1*rng.randn(30)
+    fit = ev.bootstrap(_slope,[x,y],n=200,seed=4,chunksize=64)
+    par = ev.bootstrap(_slope,[x,y],n=200,seed=4,chunksize=64,processes=2)
+    assert isinstance(fit,ev.errvallist) and len(fit) == 2
+    assert np.allclose(fit.e(),par.e())
+    with pytest.raises(ValueError):
+        ev.jackknife(_slope,[x,y[:-1]])
+
+def test_instrument():
+    from StringIO import StringIO
+    add = ev.errval.__dict__['__add__']
+    with ev.instrumented() as ins:
+        a = ev.errval(1,2)
+        b = ev.errval((2,3))
+        c = ev.errval(a)
+        a + b + 1
+        ev.errvallist([1,2],[3,4]) * a
+        ev.linreg([1,2,3],[1,2,4],[1,1,1])
+        ev.wmean([a,b])
+    assert ev.errval.__dict__['__add__'] is add # back to the originals
+    assert ins.instantiations['numeric'] >= 1
+    assert ins.instantiations['tuple'] == 1 and ins.instantiations['copy'] >= 1
+    assert ins.instantiations['internal'] >= 2
+    assert ins.operators[('errval','__add__','errval')] == 1
+    assert ins.operators[('errval','__add__','int')] == 1
+    assert ins.operators[('errvallist','__mul__','errval')] == 1
+    assert ins.timings['linreg'][0] == 1 and ins.timings['wmean'][0] == 1
+    out = StringIO()
+    ins.report(out)
+    assert 'linreg' in out.getvalue()
+    a + b
+    assert ins.operators[('errval','__add__','errval')] == 1 # off again
@@ -0,0 +1,225 @@
+#! /usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+'''
+Let numpy work with errval's and errvallist's:
+ np.exp(errval), np.sin(errvallist), np.hypot(evl0,evl1), np.sum(evl), ...
+
+numpy hands the call over to errval.__array_ufunc__ (errvallist, errarray),
+which end up in array_ufunc() below.
+Every supported ufunc comes with its partial derivatives,
+so the whole array is propagated in one pass:
+ c = f(a+-da,b+-db)
+ => dc = sqrt( (df/da)**2 * da**2 + (df/db)**2 * db**2 )
+
+Functions that aren't ufuncs (np.sum, np.mean, ...)
+go through __array_function__ (numpy>=1.17);
+implementations are registered with @implements(np.function).
+'''
+
+import numpy as np
+
+from errval import *
+from errvallist import *
+from errarray import *
+from errarray import _columns
+
+
+# partial derivatives of the supported ufuncs
+# unary:  ufunc: df/dx(x,f)     with f = ufunc(x)
+# binary: ufunc: (df/dx(x,y,f), df/dy(x,y,f))
+_LN2, _LN10 = np.log(2), np.log(10)
+_UNARY = {
+    np.negative: lambda x,f: -np.ones_like(f),
+    np.positive: lambda x,f: np.ones_like(f),
+    np.absolute: lambda x,f: np.ones_like(f), # only |df/dx| matters
+    np.sqrt: lambda x,f: 0.5/f,
+    np.cbrt: lambda x,f: 1.0/(3*f**2),
+    np.square: lambda x,f: 2*x,
+    np.reciprocal: lambda x,f: -f**2,
+    np.exp: lambda x,f: f,
+    np.exp2: lambda x,f: _LN2*f,
+    np.expm1: lambda x,f: f+1,
+    np.log: lambda x,f: 1.0/x,
+    np.log2: lambda x,f: 1.0/(_LN2*x),
+    np.log10: lambda x,f: 1.0/(_LN10*x),
+    np.log1p: lambda x,f: 1.0/(1+x),
+    np.sin: lambda x,f: np.cos(x),
+    np.cos: lambda x,f: -np.sin(x),
+    np.tan: lambda x,f: 1+f**2,
+    np.arcsin: lambda x,f: 1.0/np.sqrt(1-x**2),
+    np.arccos: lambda x,f: -1.0/np.sqrt(1-x**2),
+    np.arctan: lambda x,f: 1.0/(1+x**2),
+    np.sinh: lambda x,f: np.cosh(x),
+    np.cosh: lambda x,f: np.sinh(x),
+    np.tanh: lambda x,f: 1-f**2,
+    np.arcsinh: lambda x,f: 1.0/np.sqrt(x**2+1),
+    np.arccosh: lambda x,f: 1.0/np.sqrt(x**2-1),
+    np.arctanh: lambda x,f: 1.0/(1-x**2),
+    np.deg2rad: lambda x,f: np.pi/180*np.ones_like(f),
+    np.rad2deg: lambda x,f: 180/np.pi*np.ones_like(f),
+    }
+_UNARY[np.radians] = _UNARY[np.deg2rad]
+_UNARY[np.degrees] = _UNARY[np.rad2deg]
+
+_BINARY = {
+    np.add: (lambda x,y,f: np.ones_like(f), lambda x,y,f: np.ones_like(f)),
+    np.subtract: (lambda x,y,f: np.ones_like(f), lambda x,y,f: -np.ones_like(f)),
+    np.multiply: (lambda x,y,f: y*np.ones_like(f), lambda x,y,f: x*np.ones_like(f)),
+    np.divide: (lambda x,y,f: 1.0/y*np.ones_like(f), lambda x,y,f: -f/y),
+    np.power: (lambda x,y,f: y*x**(y-1.0), lambda x,y,f: np.log(x)*f),
+    np.hypot: (lambda x,y,f: x/f, lambda x,y,f: y/f),
+    np.arctan2: (lambda x,y,f: y/(x**2+y**2), lambda x,y,f: -x/(x**2+y**2)),
+    }
+_BINARY[np.true_divide] = _BINARY[np.divide]
+
+
+def supported(ufunc):
+    return ufunc in _UNARY or ufunc in _BINARY
+
+def derivatives(ufunc,*values):
+    '''
+    evaluate ufunc on plain values (numbers or arrays)
+    returns f, [df/dx0, df/dx1, ...]
+    '''
+    f = ufunc(*values)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        if len(values)==1:
+            d = [_UNARY[ufunc](values[0],f)]
+        else:
+            d = [df(values[0],values[1],f) for df in _BINARY[ufunc]]
+    return f, d
+
+def propagate(ufunc,values,errors):
+    '''
+    values and errors are lists with one entry per ufunc input;
+    an error of None marks an exact input (e.g. a plain number)
+    returns value and error of the result
+    '''
+    f, d = derivatives(ufunc,*values)
+    return f, combine(np.shape(f),d,errors)
+
+def combine(shape,derivatives,errors):
+    '''
+    the first order error sqrt( sum_i (df/dx_i)**2 * dx_i**2 ) of a result of the given shape,
+    from the derivatives df/dx_i and errors dx_i of its inputs;
+    an input with error None or 0 is exact and doesn't contribute,
+    even where its derivative is nan or inf (e.g. log(0) in the derivative of 0**y)
+    '''
+    var = np.zeros(shape)
+    for d, e in zip(derivatives,errors):
+        if e is None: continue
+        var = var + np.where(e==0,0,d*e)**2
+    return np.sqrt(var)
+
+
+def wrap(v,e,printout='latex',array=False):
+    # bring value and error arrays back into errorvalues form:
+    # errval (0-d), errvallist (1-d) or errarray (more dimensions, or array=True)
+    if np.ndim(v)==0:
+        return errval._new(float(v),float(e),printout)
+    if np.ndim(v)==1 and not array:
+        return errvallist._from_arrays(np.ascontiguousarray(v,dtype=np.float64),
+                                       np.ascontiguousarray(e,dtype=np.float64),
+                                       printout)
+    return errarray._from_arrays(np.asarray(v,dtype=np.float64),np.asarray(e,dtype=np.float64),printout)
+
+def array_ufunc(ufunc,method,inputs,kwargs):
+    '''
+    entry point of errval.__array_ufunc__ and errvallist.__array_ufunc__
+    returns NotImplemented for anything that isn't supported,
+    numpy then raises the appropriate TypeError
+    '''
+    out = kwargs.pop('out',None)
+    if isinstance(out,tuple): out = out[0] if len(out)==1 else NotImplemented
+    if out is not None and not isinstance(out,(errvallist,errarray)):
+        return NotImplemented
+    columns = [_columns(x) for x in inputs]
+    printouts = [c[2] for c in columns if c[2] is not None]
+    printout = printouts[0] if printouts else 'latex'
+
+    if method=='__call__' and supported(ufunc):
+        if kwargs:
+            return NotImplemented
+        v, e = propagate(ufunc,[c[0] for c in columns],[c[1] for c in columns])
+        if out is not None:
+            # out = errvallist: the result goes into its buffers
+            if np.shape(v)!=np.shape(out.v()):
+                raise ValueError, 'Cannot write a result of shape {0} to out of shape {1}'.format(np.shape(v),np.shape(out.v()))
+            out.v()[...], out.e()[...] = v, e
+            return out
+        # errarray's stay errarray's
+        return wrap(v,e,printout,any([isinstance(x,errarray) for x in inputs]))
+
+    if method=='reduce' and ufunc is np.add and isinstance(inputs[0],(errvallist,errarray)):
+        # np.add.reduce
+        if out is not None or kwargs.get('keepdims',False) or 'initial' in kwargs or 'where' in kwargs:
+            return NotImplemented
+        return inputs[0].sum(kwargs.get('axis',0))
+
+    return NotImplemented
+
+
+# -----------------------------------------------------------------------
+
+_HANDLED_FUNCTIONS = {}
+
+def implements(np_function):
+    # register an implementation for __array_function__
+    def decorator(func):
+        _HANDLED_FUNCTIONS[np_function] = func
+        return func
+    return decorator
+
+def array_function(func,types,args,kwargs):
+    '''
+    entry point of errvallist.__array_function__ (numpy>=1.17)
+    anything not registered falls back to numpy's own implementation,
+    which treats the errvallist as a sequence of errval's
+    '''
+    if func in _HANDLED_FUNCTIONS:
+        return _HANDLED_FUNCTIONS[func](*args,**kwargs)
+    implementation = getattr(func,'_implementation',None)
+    if implementation is None:
+        return NotImplemented
+    return implementation(*args,**kwargs)
+
+@implements(np.sum)
+def _sum(a,axis=None,dtype=None,out=None,keepdims=False):
+    return a.sum(axis,dtype,out,keepdims)
+
+@implements(np.mean)
+def _mean(a,axis=None,dtype=None,out=None,keepdims=False):
+    return a.mean(axis,dtype,out,keepdims)
+
+@implements(np.cumsum)
+def _cumsum(a,axis=None,dtype=None,out=None):
+    return a.cumsum(axis,dtype,out)
+
+@implements(np.argmax)
+def _argmax(a,axis=None,out=None):
+    return a.argmax(axis,out)
+
+@implements(np.argmin)
+def _argmin(a,axis=None,out=None):
+    return a.argmin(axis,out)
+
+@implements(np.amax)
+def _amax(a,axis=None,out=None,keepdims=False):
+    return a.max(axis,out,keepdims)
+
+@implements(np.amin)
+def _amin(a,axis=None,out=None,keepdims=False):
+    return a.min(axis,out,keepdims)
+
+@implements(np.argsort)
+def _argsort(a,axis=-1,kind=None,order=None):
+    return a.argsort()
+
+@implements(np.sort)
+def _sort(a,axis=-1,kind=None,order=None):
+    return a.take(a.argsort())
+
+@implements(np.take)
+def _take(a,indices,axis=None,out=None,mode='raise'):
+    return a.take(indices)